@@ -0,0 +1,213 @@
+"""
+Benchmarks an end-to-end crawl and EbookBuilder.build against the local
+stub site (benchmarks/stub_site.py), at several book sizes.
+
+- "crawl": FanNovelsParser reads the novel page and the AJAX chapter list,
+  then every chapter is downloaded with iter_chapters and streamed into
+  volumes with build_volumes, as the bot does (minus the upload).
+- "build": EbookBuilder.build on in-memory chapters, no network.
+
+Each case runs in a fresh process so its peak RSS is its own. Results are
+written to --output as JSON; pass an earlier file as --compare to see the
+change between commits.
+
+    python -m benchmarks.bench_crawl --chapters 100 1000 10000 --latency 0.005
+    python -m benchmarks.bench_crawl --output new.json --compare old.json
+
+The chapter cache is disabled and the throttle kept in memory, and the
+per-host limits are raised (--rate, --host-concurrency) so the stub, not
+the politeness settings, is what the crawl waits on.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+from benchmarks.stub_site import StubSite, make_paragraphs
+from lncrawl.binders.epub import EbookBuilder
+from lncrawl.core.parse_pool import shutdown_parse_pool
+from sources.en.f.fannovels_parser import FanNovelsParser
+
+# Chapter request latencies of the crawl running in this process
+latencies = []
+
+class BenchParser(FanNovelsParser):
+    """
+    FanNovelsParser that records chapter request latencies. It's defined at
+    module level so parse pool processes can import it.
+    """
+    def fetch(self, url, **kwargs):
+        start = time.perf_counter()
+        response = super().fetch(url, **kwargs)
+        if '/chapter-' in url:
+            latencies.append(time.perf_counter() - start)
+        return response
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+def summarize(benchmark, chapters, seconds, latencies, nbytes):
+    return {
+        "benchmark": benchmark,
+        "chapters": chapters,
+        "seconds": round(seconds, 4),
+        "chapters_per_second": round(chapters / seconds, 2),
+        "mb_per_second": round(nbytes / 1024 / 1024 / seconds, 2),
+        "latency_p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "latency_p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+def run_crawl(novel_url, chapters, settings):
+    """Crawls one synthetic novel; runs in its own process."""
+    BenchParser.rate_limit = BenchParser.rate_burst = settings['rate']
+    BenchParser.host_concurrency = settings['host_concurrency']
+    with tempfile.TemporaryDirectory() as output_dir:
+        start = time.perf_counter()
+        parser = BenchParser(novel_url)
+        parser.read_novel_info()
+        assert len(parser.chapters) == chapters, f"found {len(parser.chapters)} of {chapters} chapters"
+        volumes = EbookBuilder().build_volumes(
+            title=parser.novel_title,
+            author=parser.novel_author,
+            cover_url=parser.novel_cover,
+            chapters=parser.iter_chapters(
+                parser.chapters,
+                concurrency=settings['concurrency'],
+                window=settings['window'],
+            ),
+            output_dir=output_dir,
+            max_bytes=45 * 1024 * 1024,
+        )
+        try:
+            for _ in volumes:
+                pass
+        finally:
+            shutdown_parse_pool()
+        seconds = time.perf_counter() - start
+    return summarize("crawl", chapters, seconds, latencies, parser.stats['bytes'])
+
+def run_build(chapters, settings):
+    """Builds one book from in-memory chapters; runs in its own process."""
+    class BenchBuilder(EbookBuilder):
+        def add_chapter(self, title, body):
+            start = time.perf_counter()
+            super().add_chapter(title, body)
+            latencies.append(time.perf_counter() - start)
+
+    body = make_paragraphs(settings['chapter_size'])
+    book = [{"title": f"Chapter {n}", "body": body} for n in range(1, chapters + 1)]
+    with tempfile.TemporaryDirectory() as output_dir:
+        start = time.perf_counter()
+        BenchBuilder().build("Synthetic Novel", "Stub Author", None, book, os.path.join(output_dir, "book.epub"))
+        seconds = time.perf_counter() - start
+    return summarize("build", chapters, seconds, latencies, len(body.encode('utf-8')) * chapters)
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline_path):
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    previous = {(r['benchmark'], r['chapters']): r for r in baseline['results']}
+    print()
+    print(f"Compared with {baseline_path} ({baseline.get('commit') or 'unknown commit'}):")
+    for result in results:
+        old = previous.get((result['benchmark'], result['chapters']))
+        if not old:
+            continue
+        changes = []
+        for key in ('chapters_per_second', 'latency_p99_ms', 'peak_rss_mb'):
+            if old[key]:
+                changes.append(f"{key} {(result[key] - old[key]) / old[key] * 100:+.1f}%")
+        print(f"{result['benchmark']:>8} {result['chapters']:>7}  " + ", ".join(changes))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chapters', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--benchmarks', nargs='+', choices=['crawl', 'build'], default=['crawl', 'build'])
+    parser.add_argument('--latency', type=float, default=0.005, help="stub response delay in seconds")
+    parser.add_argument('--jitter', type=float, default=0.005, help="random extra delay, up to this much")
+    parser.add_argument('--chapter-size', type=int, default=20000, help="bytes of text per chapter")
+    parser.add_argument('--concurrency', type=int, default=8, help="chapters fetched at once per novel")
+    parser.add_argument('--window', type=int, default=32, help="chapter bodies held in memory")
+    parser.add_argument('--host-concurrency', type=int, default=16)
+    parser.add_argument('--rate', type=float, default=10000, help="requests per second to the stub host")
+    parser.add_argument('--parse-processes', default='0', help="PARSE_PROCESSES for the crawl (a number or auto)")
+    parser.add_argument('--output', default='bench_crawl.json')
+    parser.add_argument('--compare', metavar='BASELINE', help="an earlier --output file")
+    args = parser.parse_args()
+
+    # Read by the child processes on first use
+    os.environ['CHAPTER_CACHE_PATH'] = ''
+    os.environ['THROTTLE_STATE_PATH'] = ''
+    os.environ['PARSE_PROCESSES'] = args.parse_processes
+    settings = {
+        "latency": args.latency,
+        "jitter": args.jitter,
+        "chapter_size": args.chapter_size,
+        "concurrency": args.concurrency,
+        "window": args.window,
+        "host_concurrency": args.host_concurrency,
+        "rate": args.rate,
+        "parse_processes": args.parse_processes,
+    }
+
+    context = multiprocessing.get_context('spawn')
+    results = []
+    print(f"{'benchmark':>9} {'chapters':>8} {'seconds':>9} {'ch/s':>9} {'MB/s':>7} {'p50 ms':>8} {'p99 ms':>8} {'RSS MB':>7}")
+    with StubSite(args.latency, args.jitter, args.chapter_size) as site:
+        for chapters in args.chapters:
+            for benchmark in args.benchmarks:
+                # Not a multiprocessing.Pool: its daemonic workers can't start a parse pool
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as runner:
+                    if benchmark == 'crawl':
+                        result = runner.submit(run_crawl, site.novel_url(chapters), chapters, settings).result()
+                    else:
+                        result = runner.submit(run_build, chapters, settings).result()
+                results.append(result)
+                print(
+                    f"{result['benchmark']:>9} {result['chapters']:>8} {result['seconds']:>9.2f} "
+                    f"{result['chapters_per_second']:>9.1f} {result['mb_per_second']:>7.1f} "
+                    f"{result['latency_p50_ms']:>8.2f} {result['latency_p99_ms']:>8.2f} {result['peak_rss_mb']:>7.1f}"
+                )
+
+    report = {
+        "commit": git_commit(),
+        "date": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": settings,
+        "results": results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == '__main__':
+    main()
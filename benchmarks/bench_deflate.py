@@ -0,0 +1,54 @@
+"""
+Benchmarks EbookBuilder.build with chapters compressed on 1, 2, 4 and 8
+threads, on synthetic chapters held in memory.
+
+The speedup is bounded by the number of cores: zlib compresses without
+the GIL, but templating and writing the archive still happen on the
+calling thread.
+
+    python -m benchmarks.bench_deflate --chapters 2000 --threads 1 2 4 8 --level 6
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.stub_site import make_paragraphs
+from lncrawl.binders.epub import EbookBuilder
+
+def time_build(book, threads, level, repeat):
+    best = None
+    with tempfile.TemporaryDirectory() as output_dir:
+        path = os.path.join(output_dir, "book.epub")
+        for _ in range(repeat):
+            builder = EbookBuilder(compress_threads=threads, compress_level=level)
+            start = time.perf_counter()
+            builder.build("Synthetic Novel", "Stub Author", None, book, path)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        size = os.path.getsize(path)
+    return best, size
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chapters', type=int, default=2000)
+    parser.add_argument('--chapter-size', type=int, default=20000, help="bytes of text per chapter")
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--level', type=int, default=6, help="zlib compression level")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    book = [
+        {"title": f"Chapter {n}", "body": make_paragraphs(args.chapter_size, seed=n)}
+        for n in range(1, args.chapters + 1)
+    ]
+    print(f"{os.cpu_count()} cores, {args.chapters} chapters, level {args.level}")
+    print(f"{'threads':>8} {'seconds':>9} {'MB':>7} {'speedup':>8}")
+    baseline = None
+    for threads in args.threads:
+        seconds, size = time_build(book, threads, args.level, args.repeat)
+        baseline = baseline or seconds
+        print(f"{threads:>8} {seconds:>9.3f} {size / 1024 / 1024:>7.1f} {baseline / seconds:>7.2f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""
+Benchmarks OPF/NCX generation for large synthetic books.
+
+Compares the streaming template writer in EbookBuilder with the previous
+xml.dom.minidom implementation, kept here as LegacyEbookBuilder.
+
+    python -m benchmarks.bench_opf --chapters 1000 10000 --repeat 3
+"""
+import argparse
+import io
+import os
+import time
+import uuid
+from datetime import datetime
+from xml.dom.minidom import Document
+
+from lncrawl.binders.epub import ASSETS_PATH, EbookBuilder
+
+class LegacyEbookBuilder(EbookBuilder):
+    """EbookBuilder with the minidom based OPF/NCX generation."""
+
+    def _create_content_opf(self, cover_filename):
+        doc = Document()
+        package = doc.createElement('package')
+        package.setAttribute('xmlns', 'http://www.idpf.org/2007/opf')
+        package.setAttribute('unique-identifier', 'bookid')
+        package.setAttribute('version', '2.0')
+        doc.appendChild(package)
+
+        # METADATA
+        metadata = doc.createElement('metadata')
+        metadata.setAttribute('xmlns:dc', 'http://purl.org/dc/elements/1.1/')
+        metadata.setAttribute('xmlns:opf', 'http://www.idpf.org/2007/opf')
+        package.appendChild(metadata)
+        
+        # -- Title, Author, Date, ID
+        title_el = doc.createElement('dc:title')
+        title_el.appendChild(doc.createTextNode(self.novel_title))
+        metadata.appendChild(title_el)
+        
+        creator_el = doc.createElement('dc:creator')
+        creator_el.appendChild(doc.createTextNode(self.novel_author))
+        metadata.appendChild(creator_el)
+
+        date_el = doc.createElement('dc:date')
+        date_el.appendChild(doc.createTextNode(datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')))
+        metadata.appendChild(date_el)
+
+        id_el = doc.createElement('dc:identifier')
+        id_el.setAttribute('id', 'bookid')
+        id_el.appendChild(doc.createTextNode(str(uuid.uuid4())))
+        metadata.appendChild(id_el)
+        
+        # -- Cover
+        if cover_filename:
+            meta_cover = doc.createElement('meta')
+            meta_cover.setAttribute('name', 'cover')
+            meta_cover.setAttribute('content', 'cover-image')
+            metadata.appendChild(meta_cover)
+
+        # MANIFEST
+        manifest = doc.createElement('manifest')
+        package.appendChild(manifest)
+        
+        # -- Manifest items
+        self._add_manifest_item(doc, manifest, 'ncx', 'toc.ncx', 'application/x-dtbncx+xml')
+        self._add_manifest_item(doc, manifest, 'style', 'style.css', 'text/css')
+        if cover_filename:
+            self._add_manifest_item(doc, manifest, 'cover-image', f'Images/{cover_filename}', 'image/jpeg')
+            self._add_manifest_item(doc, manifest, 'cover-page', 'Text/cover.xhtml', 'application/xhtml+xml')
+            with open(os.path.join(ASSETS_PATH, 'cover.xhtml'), 'r') as f:
+                cover_xhtml = f.read().replace('{{cover_path}}', f'../Images/{cover_filename}')
+            self._write_entry('OEBPS/Text/cover.xhtml', cover_xhtml.encode('utf-8'))
+        
+        for chapter_info in self.toc:
+            self._add_manifest_item(doc, manifest, chapter_info['id'], f"Text/{chapter_info['filename']}", 'application/xhtml+xml')
+
+        # SPINE
+        spine = doc.createElement('spine')
+        spine.setAttribute('toc', 'ncx')
+        package.appendChild(spine)
+        
+        if cover_filename:
+            self._add_spine_item(doc, spine, 'cover-page')
+            
+        for chapter_info in self.toc:
+            self._add_spine_item(doc, spine, chapter_info['id'])
+
+        # GUIDE
+        if cover_filename:
+            guide = doc.createElement('guide')
+            package.appendChild(guide)
+            ref = doc.createElement('reference')
+            ref.setAttribute('type', 'cover')
+            ref.setAttribute('title', 'Cover')
+            ref.setAttribute('href', 'Text/cover.xhtml')
+            guide.appendChild(ref)
+            
+        self._write_entry('OEBPS/content.opf', doc.toprettyxml(indent='  ').encode('utf-8'))
+
+    def _add_manifest_item(self, doc, manifest, item_id, href, media_type):
+        item = doc.createElement('item')
+        item.setAttribute('id', item_id)
+        item.setAttribute('href', href)
+        item.setAttribute('media-type', media_type)
+        manifest.appendChild(item)
+
+    def _add_spine_item(self, doc, spine, idref):
+        item = doc.createElement('itemref')
+        item.setAttribute('idref', idref)
+        spine.appendChild(item)
+
+    def _create_toc_ncx(self):
+        doc = Document()
+        ncx = doc.createElement('ncx')
+        ncx.setAttribute('xmlns', 'http://www.daisy.org/z3986/2005/ncx/')
+        ncx.setAttribute('version', '2005-1')
+        doc.appendChild(ncx)
+
+        head = doc.createElement('head')
+        ncx.appendChild(head)
+        self._add_meta(doc, head, 'dtb:uid', str(uuid.uuid4()))
+        self._add_meta(doc, head, 'dtb:depth', '1')
+
+        doc_title = doc.createElement('docTitle')
+        title_text = doc.createElement('text')
+        title_text.appendChild(doc.createTextNode(self.novel_title))
+        doc_title.appendChild(title_text)
+        ncx.appendChild(doc_title)
+        
+        nav_map = doc.createElement('navMap')
+        ncx.appendChild(nav_map)
+        
+        for i, chapter_info in enumerate(self.toc):
+            nav_point = doc.createElement('navPoint')
+            nav_point.setAttribute('id', f"nav_{i+1}")
+            nav_point.setAttribute('playOrder', str(i+1))
+            
+            nav_label = doc.createElement('navLabel')
+            text_node = doc.createElement('text')
+            text_node.appendChild(doc.createTextNode(chapter_info['title']))
+            nav_label.appendChild(text_node)
+            nav_point.appendChild(nav_label)
+            
+            content = doc.createElement('content')
+            content.setAttribute('src', f"Text/{chapter_info['filename']}")
+            nav_point.appendChild(content)
+            
+            nav_map.appendChild(nav_point)
+
+        self._write_entry('OEBPS/toc.ncx', doc.toprettyxml(indent='  ').encode('utf-8'))
+
+    def _add_meta(self, doc, head, name, content):
+        meta = doc.createElement('meta')
+        meta.setAttribute('name', name)
+        meta.setAttribute('content', content)
+        head.appendChild(meta)
+
+def synthetic_toc(count):
+    return [
+        {'id': f"chap_{i+1}", 'filename': f"chapter_{i+1:04d}.xhtml", 'title': f"Chapter {i+1}: A & B <{i}>"}
+        for i in range(count)
+    ]
+
+def time_metadata(builder_class, toc, repeat):
+    """Returns the best time in seconds to write the OPF and NCX for `toc`."""
+    best = None
+    for _ in range(repeat):
+        builder = builder_class()
+        builder.open("Synthetic Novel", "Benchmark", None, io.BytesIO())
+        builder.toc = list(toc)
+        start = time.perf_counter()
+        builder.close()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chapters', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'chapters':>10} {'minidom (s)':>12} {'streaming (s)':>14} {'speedup':>8}")
+    for count in args.chapters:
+        toc = synthetic_toc(count)
+        before = time_metadata(LegacyEbookBuilder, toc, args.repeat)
+        after = time_metadata(EbookBuilder, toc, args.repeat)
+        print(f"{count:>10} {before:>12.3f} {after:>14.3f} {before / after:>7.1f}x")
+
+if __name__ == '__main__':
+    main()
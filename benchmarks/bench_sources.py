@@ -0,0 +1,116 @@
+"""
+Benchmarks source registry start-up and lookup with many source modules.
+
+Generates --modules synthetic parser modules in a temporary package and
+compares the previous eager loader, which imported every module at
+start-up, with the lazy manifest-backed SourceManager (cold: manifest
+built from the sources, warm: manifest read from disk).
+
+    python -m benchmarks.bench_sources --modules 500
+"""
+import argparse
+import importlib
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from urllib.parse import urlparse
+
+from lncrawl.core.sources import SourceManager
+
+MODULE_TEMPLATE = '''from bs4 import BeautifulSoup
+from lncrawl.parser import WebToEpubParser
+
+class Site{n}Parser(WebToEpubParser):
+    base_url = [
+        "https://site{n}.com/",
+        "https://www.site{n}-mirror.net/",
+    ]
+
+    def get_chapter_urls(self, dom):
+        return []
+
+    def find_content(self, dom):
+        return dom.select_one("#content")
+'''
+
+def generate_sources(root, package, count):
+    sources_dir = os.path.join(root, package)
+    for n in range(count):
+        directory = os.path.join(sources_dir, f"s{n % 26:02d}")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"site{n}_parser.py"), 'w') as f:
+            f.write(MODULE_TEMPLATE.format(n=n))
+    for directory, _, _ in os.walk(sources_dir):
+        open(os.path.join(directory, '__init__.py'), 'w').close()
+    return sources_dir
+
+def eager_load(sources_dir):
+    """The previous SourceManager.load_parsers: import everything up front."""
+    package_root = os.path.dirname(sources_dir)
+    parsers = {}
+    for root, _, files in os.walk(sources_dir):
+        for file in files:
+            if file.endswith('.py') and not file.startswith('__'):
+                relative_path = os.path.relpath(os.path.join(root, file), package_root)
+                module = importlib.import_module(relative_path.replace(os.sep, '.')[:-3])
+                for attr_name in dir(module):
+                    if attr_name.endswith('Parser') and attr_name != 'WebToEpubParser':
+                        ParserClass = getattr(module, attr_name)
+                        if isinstance(getattr(ParserClass, 'base_url', None), list):
+                            for url in ParserClass.base_url:
+                                parsers[urlparse(url).netloc] = ParserClass
+    return parsers
+
+def forget_modules(package):
+    for name in list(sys.modules):
+        if name == package or name.startswith(package + '.'):
+            del sys.modules[name]
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modules', type=int, default=500)
+    parser.add_argument('--lookups', type=int, default=100000)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    package = f"bench_sources_{os.getpid()}"
+    try:
+        sources_dir = generate_sources(root, package, args.modules)
+        index_path = os.path.join(root, 'index.json')
+        sys.path.insert(0, root)
+        importlib.invalidate_caches()
+
+        eager, _ = timed(lambda: eager_load(sources_dir))
+        forget_modules(package)
+        cold, _ = timed(lambda: SourceManager(sources_dir, index_path))
+        warm, manager = timed(lambda: SourceManager(sources_dir, index_path))
+
+        print(f"{'start-up':>24} {'seconds':>10}")
+        print(f"{'eager imports':>24} {eager:>10.3f}")
+        print(f"{'lazy, building index':>24} {cold:>10.3f}")
+        print(f"{'lazy, cached index':>24} {warm:>10.3f}")
+
+        hosts = [f"https://chapters.site{random.randrange(args.modules)}-mirror.net/novel/1" for _ in range(args.lookups)]
+        lookup, _ = timed(lambda: [manager.find_source(url) for url in hosts])
+        first, _ = timed(lambda: manager.get_parser_class(hosts[0]))
+        again, _ = timed(lambda: manager.get_parser_class(hosts[0]))
+        print()
+        print(f"{'lookup':>24} {'microseconds':>12}")
+        print(f"{'subdomain lookup':>24} {lookup / args.lookups * 1e6:>12.2f}")
+        print(f"{'first use (import)':>24} {first * 1e6:>12.0f}")
+        print(f"{'later use':>24} {again * 1e6:>12.2f}")
+    finally:
+        if root in sys.path:
+            sys.path.remove(root)
+        shutil.rmtree(root)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""
+Benchmarks webhook throughput of the two ways of handling Telegram updates:
+
+- "asyncio.run": the previous path, a new event loop per update and the
+  HTTP request blocked until the handler finishes.
+- "persistent loop": the current path, TelegramBot.start_background_loop
+  and submit_update as main.py uses them. The request is answered right
+  away and the Application processes the queued updates on one loop, one
+  at a time unless --concurrency says otherwise. One at a time, as the
+  bot runs, updates are answered sooner but processed no faster than one
+  per --handler-ms.
+
+Both run a real python-telegram-bot Application with one handler that
+awaits for --handler-ms in place of the bot's. Its only API call, getMe,
+is answered locally, so no Telegram token or network is needed.
+
+    python -m benchmarks.bench_webhook --requests 500 --clients 16
+"""
+import argparse
+import asyncio
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from flask import Flask, request
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+from telegram.request import BaseRequest
+from werkzeug.serving import make_server
+
+from bot import TelegramBot
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+
+class LocalRequest(BaseRequest):
+    """Answers the Bot API calls the Application makes without a network."""
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        return 200, json.dumps({"ok": True, "result": BOT_USER}).encode()
+
+class StubHandler:
+    def __init__(self, handler_seconds):
+        self.handler_seconds = handler_seconds
+        self.processed = 0
+        self.lock = threading.Lock()
+
+    async def __call__(self, update, context):
+        await asyncio.sleep(self.handler_seconds)
+        with self.lock:
+            self.processed += 1
+
+def build_application(handler, concurrency):
+    builder = Application.builder().token("1:bench").request(LocalRequest()).get_updates_request(LocalRequest())
+    if concurrency > 1:
+        builder = builder.concurrent_updates(concurrency)
+    application = builder.build()
+    application.add_handler(TypeHandler(Update, handler))
+    return application
+
+def legacy_app(application):
+    asyncio.run(application.initialize())
+    app = Flask(__name__)
+
+    @app.route("/webhook", methods=["POST"])
+    def webhook():
+        update = Update.de_json(request.get_json(force=True), application.bot)
+        asyncio.run(application.process_update(update))
+        return "ok"
+
+    return app
+
+def persistent_loop_app(application):
+    # TelegramBot's own loop and queueing, without the rest of its setup
+    bot = TelegramBot.__new__(TelegramBot)
+    bot.application = application
+    bot.start_background_loop()
+    app = Flask(__name__)
+
+    @app.route("/webhook", methods=["POST"])
+    def webhook():
+        update = Update.de_json(request.get_json(force=True), bot.application.bot)
+        bot.submit_update(update)
+        return "ok"
+
+    def shutdown():
+        bot.run_coroutine(application.stop())
+        bot.run_coroutine(application.shutdown())
+        bot.loop.call_soon_threadsafe(bot.loop.stop)
+
+    app.shutdown = shutdown
+    return app
+
+def make_update(update_id):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": 1000 + update_id % 50, "type": "private"},
+            "text": "hello",
+        },
+    }
+
+def run(name, app, handler, total, clients):
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/webhook"
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=clients))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        list(executor.map(lambda i: session.post(url, json=make_update(i)), range(total)))
+    answered = time.perf_counter() - start
+    while handler.processed < total:
+        time.sleep(0.001)
+    processed = time.perf_counter() - start
+    server.shutdown()
+    if hasattr(app, "shutdown"):
+        app.shutdown()
+
+    print(f"{name:>16} {total / answered:>14.0f} {total / processed:>15.0f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--handler-ms', type=float, default=50)
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help="updates the persistent loop processes at once; the bot uses 1")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    print(f"{'mode':>16} {'answered req/s':>14} {'processed upd/s':>15}")
+    handler = StubHandler(args.handler_ms / 1000)
+    run("asyncio.run", legacy_app(build_application(handler, 1)), handler, args.requests, args.clients)
+    handler = StubHandler(args.handler_ms / 1000)
+    application = build_application(handler, args.concurrency)
+    run("persistent loop", persistent_loop_app(application), handler, args.requests, args.clients)
+
+if __name__ == '__main__':
+    main()
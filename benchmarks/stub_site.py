@@ -0,0 +1,179 @@
+"""
+A local HTTP stub that serves synthetic novels in the page shape that
+FanNovelsParser expects, so crawls can be measured without the network.
+
+- /novel/<chapters>                     novel page with input#novelId
+- /ajax/chapter-archive?novelId=<id>    chapter list (ul.list-chapter)
+- /novel/<chapters>/chapter-<n>         chapter page with #chapter-content
+- /cover.jpg                            a small JPEG cover
+
+The novel id is the number of chapters, so any size can be requested.
+Every response is delayed by `latency` seconds, plus up to `jitter`.
+
+    python -m benchmarks.stub_site --port 8000 --latency 0.05
+"""
+import argparse
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import parse_qs, urlparse
+
+from PIL import Image
+
+WORDS = (
+    "the cultivator raised his sword and the heavens trembled as ancient "
+    "qi gathered around the peak while disciples watched in silence"
+).split()
+
+NOVEL_PAGE = """<!DOCTYPE html>
+<html><head><title>Novel {chapters}</title>
+<meta property="og:title" content="Synthetic Novel {chapters}"></head>
+<body>
+<div class="book"><img src="/cover.jpg" alt="cover"></div>
+<h3 class="title">Synthetic Novel {chapters}</h3>
+<div class="info"><a href="/author/stub">Stub Author</a></div>
+<input type="hidden" id="novelId" value="{chapters}">
+<div id="list-chapter">Loading...</div>
+</body></html>"""
+
+CHAPTER_PAGE = """<!DOCTYPE html>
+<html><head><title>Chapter {number}</title></head>
+<body>
+<div class="navbar">{navigation}</div>
+<div id="chapter-content">
+<h4>Chapter {number}</h4>
+<div class="ads-holder">Advertisement</div>
+{paragraphs}
+<div class="cha-note">Translator note</div>
+</div>
+<div class="footer">{navigation}</div>
+</body></html>"""
+
+def make_paragraphs(size, seed=0):
+    """Returns roughly `size` bytes of paragraphs of filler text."""
+    rng = random.Random(seed)
+    paragraphs = []
+    written = 0
+    while written < size:
+        text = " ".join(rng.choice(WORDS) for _ in range(60)).capitalize() + "."
+        paragraphs.append(f"<p>{text}</p>")
+        written += len(text) + 8
+    return "\n".join(paragraphs)
+
+def make_cover():
+    image = Image.new("RGB", (600, 900), (40, 60, 90))
+    buffer = BytesIO()
+    image.save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+class StubSite:
+    def __init__(self, latency=0.0, jitter=0.0, chapter_size=20000, host="127.0.0.1", port=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.requests = 0
+        self.lock = threading.Lock()
+        # Pages of one novel only differ in their number, so the filler is shared
+        self.paragraphs = make_paragraphs(chapter_size)
+        self.navigation = " ".join(f'<a href="#">link {i}</a>' for i in range(40))
+        self.cover = make_cover()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def novel_url(self, chapters):
+        return f"{self.base_url}/novel/{chapters}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name="stub_site", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def route(self, url):
+        """Returns `(status, content_type, body)` for a request path."""
+        parsed = urlparse(url)
+        path = parsed.path
+        if path == "/cover.jpg":
+            return 200, "image/jpeg", self.cover
+        if path == "/ajax/chapter-archive":
+            novel_id = parse_qs(parsed.query).get("novelId", [""])[0]
+            if not novel_id.isdigit():
+                return 404, "text/plain", b"unknown novel"
+            return 200, "text/html", self.chapter_list(int(novel_id)).encode("utf-8")
+        match = re.fullmatch(r"/novel/(\d+)(?:/chapter-(\d+))?", path)
+        if not match:
+            return 404, "text/plain", b"not found"
+        chapters, number = match.groups()
+        if number is None:
+            return 200, "text/html", NOVEL_PAGE.format(chapters=chapters).encode("utf-8")
+        if not 1 <= int(number) <= int(chapters):
+            return 404, "text/plain", b"no such chapter"
+        page = CHAPTER_PAGE.format(number=number, navigation=self.navigation, paragraphs=self.paragraphs)
+        return 200, "text/html", page.encode("utf-8")
+
+    def chapter_list(self, chapters):
+        items = "\n".join(
+            f'<li><a href="/novel/{chapters}/chapter-{n}">Chapter {n}</a></li>'
+            for n in range(1, chapters + 1)
+        )
+        return f'<ul class="list-chapter">\n{items}\n</ul>'
+
+    def _handler(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are written separately; without this, delayed
+            # ACKs add ~40 ms to every keep-alive response
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                with site.lock:
+                    site.requests += 1
+                delay = site.latency + random.uniform(0, site.jitter)
+                if delay:
+                    time.sleep(delay)
+                status, content_type, body = site.route(self.path)
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument('--jitter', type=float, default=0.0, help="random extra seconds, up to this much")
+    parser.add_argument('--chapter-size', type=int, default=20000, help="bytes of text per chapter")
+    args = parser.parse_args()
+
+    site = StubSite(args.latency, args.jitter, args.chapter_size, port=args.port)
+    print(f"Serving synthetic novels at {site.novel_url(100)} (any chapter count works)")
+    try:
+        site.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
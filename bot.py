@@ -2,13 +2,30 @@ import asyncio
 import logging
 import os
 import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
 from concurrent.futures import ThreadPoolExecutor
 from telegram import Update
 from telegram.ext import (Application, CommandHandler, ContextTypes,
                           ConversationHandler, MessageHandler, filters)
 
-from lncrawl.binders.epub import EbookBuilder
+from lncrawl.binders.epub import BUILDER_VERSION, EbookBuilder
+from lncrawl.core import metrics
+from lncrawl.core.artifacts import ArtifactCache
+from lncrawl.core.cache import get_chapter_cache
+from lncrawl.core.checkpoints import CrawlCheckpoint
+from lncrawl.core.dispatcher import TelegramDispatcher
+from lncrawl.core.jobs import JobQueue
+from lncrawl.core.ranges import ChapterRange
+from lncrawl.core.singleflight import CrawlCoordinator
 from lncrawl.core.sources import get_source_manager
+from lncrawl.core import throttle
+from lncrawl.core.throttle import HostUnavailableError
+from lncrawl.core.urls import normalize_url
+from lncrawl.database import Database
 
 # Set up logging
 logging.basicConfig(
@@ -17,20 +34,219 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def _log_failure(future):
+    if not future.cancelled() and future.exception():
+        logger.error(f"Failed to send to a chat: {future.exception()}")
+
+class Broadcast:
+    """
+    Sends a job's messages and volumes to every chat waiting on it. Without
+    a flight that is just the requesting chat; with one, chats that join
+    late are first sent the volumes they missed, re-using Telegram file ids.
+    Progress goes in one status message per chat that is edited as the job
+    moves on.
+    """
+    def __init__(self, dispatcher, chat_id, flight=None):
+        self.dispatcher = dispatcher
+        self.chat_id = chat_id
+        self.flight = flight
+        self.file_ids = []
+        self.volumes_sent = {}
+        self.last_message = None
+        self.upload_seconds = 0.0
+        self.status_key = uuid.uuid4().hex
+        self.status_chats = set()
+        self.progress_shown = 0.0
+        self.progress_lock = threading.Lock()
+        # Guards file_ids and volumes_sent
+        self.lock = threading.RLock()
+
+    def subscribers(self):
+        return self.flight.subscribers() if self.flight else [self.chat_id]
+
+    def chats(self, subscribers=None):
+        """Returns the chats to send to, after sending them any volumes they missed."""
+        if subscribers is None:
+            subscribers = self.subscribers()
+        with self.lock:
+            for chat_id in subscribers:
+                if chat_id not in self.volumes_sent:
+                    self.volumes_sent[chat_id] = 0
+                self._catch_up(chat_id)
+        return subscribers
+
+    def send_message(self, text, subscribers=None):
+        self.last_message = text
+        for chat_id in self.chats(subscribers):
+            self._safely(self.dispatcher.send_message(chat_id, text))
+
+    def set_status(self, text):
+        # Called from chapter threads too, so it leaves catching up to the job's thread
+        for chat_id in self.subscribers():
+            self.status_chats.add(chat_id)
+            self.dispatcher.set_status(chat_id, self.status_key, text)
+
+    def show_progress(self, title, done, total, interval=3.0):
+        """
+        Shows how many chapters are done, at most every `interval` seconds:
+        each update looks up the flight's subscribers.
+        """
+        with self.progress_lock:
+            now = time.monotonic()
+            if done < total and now - self.progress_shown < interval:
+                return
+            self.progress_shown = now
+            self.set_status(f"Downloading '{title}': {done}/{total} chapters")
+
+    def end_status(self):
+        """Leaves the status messages as they are; later ones are new messages."""
+        for chat_id in list(self.status_chats):
+            self.dispatcher.end_status(chat_id, self.status_key)
+
+    def send_document(self, path, thumbnail=None):
+        with self.lock:
+            for chat_id in self.chats():
+                if len(self.file_ids) > self.volumes_sent[chat_id]:
+                    # Already uploaded for another chat
+                    self._safely(self.dispatcher.send_document(chat_id, self.file_ids[-1]))
+                else:
+                    start = time.perf_counter()
+                    message = self.dispatcher.upload(chat_id, path, thumbnail=thumbnail)
+                    elapsed = time.perf_counter() - start
+                    metrics.UPLOAD_SECONDS.observe(elapsed)
+                    self.upload_seconds += elapsed
+                    self.file_ids.append(message.document.file_id)
+                self.volumes_sent[chat_id] += 1
+
+    def resume(self, file_ids, chats):
+        """Carries on from a crawl that had sent `file_ids` to `chats` before it stopped."""
+        with self.lock:
+            self.file_ids = list(file_ids)
+            for chat_id in chats:
+                self.volumes_sent[chat_id] = len(self.file_ids)
+
+    def send_cached(self, file_ids):
+        """
+        Sends previously uploaded volumes by file id, and returns how many
+        were sent: fewer than all if Telegram rejects one, e.g. because it
+        belongs to another bot.
+        """
+        with self.lock:
+            chats = self.chats()
+            sent = 0
+            try:
+                for file_id in file_ids:
+                    self.dispatcher.send_document(chats[0], file_id).result()
+                    sent += 1
+            except Exception as e:
+                logger.warning(f"Cached file ids were rejected: {e}")
+            self.volumes_sent[chats[0]] = sent
+            self.file_ids = list(file_ids[:sent])
+            # Everyone else is caught up with the same file ids
+            self.chats()
+        return sent
+
+    def finish(self):
+        """Ends the flight and returns every chat that was served."""
+        if not self.flight:
+            return [self.chat_id]
+        flight, self.flight = self.flight, None
+        subscribers = flight.finish()
+        with self.lock:
+            late = [chat_id for chat_id in subscribers if chat_id not in self.volumes_sent]
+            if late and not self.file_ids and self.last_message:
+                # Nothing was built, so tell late joiners how it ended
+                self.send_message(self.last_message, subscribers=late)
+            return self.chats(subscribers)
+
+    def _catch_up(self, chat_id):
+        while self.volumes_sent[chat_id] < len(self.file_ids):
+            file_id = self.file_ids[self.volumes_sent[chat_id]]
+            self._safely(self.dispatcher.send_document(chat_id, file_id))
+            self.volumes_sent[chat_id] += 1
+
+    def _safely(self, future):
+        future.add_done_callback(_log_failure)
+
 class TelegramBot:
     def __init__(self):
         self.executor = ThreadPoolExecutor(max_workers=5, thread_name_prefix="telegram_bot")
+        # Jobs handed to the executor that haven't started yet
+        self.jobs_waiting = 0
+        self.jobs_waiting_lock = threading.Lock()
         self.active_sessions = {}
         self.max_active_sessions = 20
+        metrics.REGISTRY.gauge(
+            "lncrawl_executor_queue_depth", "Novel jobs waiting for a worker thread",
+            function=lambda: self.jobs_waiting,
+        )
+        metrics.REGISTRY.gauge(
+            "lncrawl_active_sessions", "Chats with a session in progress",
+            function=lambda: len(self.active_sessions),
+        )
+        self.chapter_concurrency = int(os.getenv("CHAPTER_CONCURRENCY", "8"))
+        # Max chapter bodies held in memory per job
+        self.chapter_window = int(os.getenv("CHAPTER_WINDOW", "32"))
+        # Books are split into volumes to stay under Telegram's 50 MB bot upload limit
+        self.max_volume_chapters = int(os.getenv("MAX_VOLUME_CHAPTERS", "0")) or None
+        self.max_volume_bytes = int(os.getenv("MAX_VOLUME_MB", "45")) * 1024 * 1024
+        # Chapters are compressed on this many threads; 1 keeps it on the job's thread
+        self.compress_threads = int(os.getenv("COMPRESS_THREADS", "1"))
+        self.compress_level = int(os.getenv("COMPRESS_LEVEL", "6"))
         
         self.TOKEN = os.getenv("TELEGRAM_TOKEN")
         if not self.TOKEN:
             raise Exception("Telegram token not found")
 
+        # MongoDB is optional; without it nothing is persisted between runs
+        self.database = None
+        self.job_queue = None
+        self.artifacts = None
+        mongo_uri = os.getenv("MONGO_URI")
+        if mongo_uri:
+            self.database = Database(
+                mongo_uri,
+                novel_info_ttl=int(os.getenv("NOVEL_INFO_TTL", "21600")),
+                checkpoint_ttl=int(os.getenv("CHECKPOINT_TTL", "259200")),
+            )
+            # With the durable queue, jobs are run by worker.py processes
+            if os.getenv("JOB_QUEUE", "").lower() == "mongo":
+                self.job_queue = JobQueue(self.database)
+            self.artifacts = ArtifactCache(
+                self.database,
+                local_dir=os.getenv("ARTIFACT_CACHE_DIR") or None,
+                max_bytes=int(os.getenv("ARTIFACT_CACHE_MB", "1024")) * 1024 * 1024,
+            )
+            # Per-host rate limits are shared by every container
+            throttle_state = throttle.use_database(self.database)
+            try:
+                self.database.ensure_indexes()
+                self.artifacts.ensure_indexes()
+                throttle_state.ensure_indexes()
+                if self.job_queue:
+                    self.job_queue.ensure_indexes()
+            except Exception as e:
+                logger.error(f"Failed to create database indexes: {e}")
+        # Identical crawls requested at the same time are only run once
+        self.crawls = CrawlCoordinator(self.database)
+        try:
+            self.crawls.ensure_indexes()
+        except Exception as e:
+            logger.error(f"Failed to create crawl lease indexes: {e}")
+        # Chats whose jobs jump the queue, e.g. the bot's admins
+        self.priority_chats = set(filter(None, os.getenv("PRIORITY_CHATS", "").split(",")))
+
         # Initialize the SourceManager here
         self.source_manager = get_source_manager()
         
-        self.application = Application.builder().token(self.TOKEN).build()
+        self.loop = None
+        self.dispatchers = {}
+        self.dispatchers_lock = threading.Lock()
+        self.application = (
+            Application.builder()
+            .token(self.TOKEN)
+            .build()
+        )
         conv_handler = ConversationHandler(
             entry_points=[CommandHandler("start", self.start_session)],
             states={
@@ -39,6 +255,49 @@ class TelegramBot:
             fallbacks=[CommandHandler("cancel", self.cancel_session)],
         )
         self.application.add_handler(conv_handler)
+        # The conversation needs updates handled one at a time; /queue is
+        # outside it and doesn't have to hold the others up
+        self.application.add_handler(CommandHandler("queue", self.show_queue, block=False))
+
+    def start_background_loop(self):
+        """
+        Starts a long-lived event loop in a daemon thread and runs the
+        Application on it. Updates put on `application.update_queue` are then
+        processed without a new event loop per update.
+        """
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name="telegram_loop", daemon=True).start()
+        self.run_coroutine(self.application.initialize())
+        self.run_coroutine(self.application.start())
+
+    def get_dispatcher(self, bot):
+        """
+        Gets the dispatcher that sends everything for `bot`, on the
+        background loop if it is running.
+        """
+        with self.dispatchers_lock:
+            dispatcher = self.dispatchers.get(id(bot))
+            if dispatcher is None:
+                dispatcher = self.dispatchers[id(bot)] = TelegramDispatcher(
+                    bot,
+                    self.loop,
+                    upload_timeout=int(os.getenv("UPLOAD_TIMEOUT", "300")),
+                )
+            return dispatcher
+
+    def submit_update(self, update):
+        """Queues an update for the background loop without waiting for it."""
+        self.loop.call_soon_threadsafe(self.application.update_queue.put_nowait, update)
+
+    def run_coroutine(self, coro):
+        """
+        Runs a coroutine from a worker thread and returns its result. The
+        bot's HTTP client belongs to the background loop, so it must be used
+        there once that loop is running.
+        """
+        if self.loop is not None:
+            return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+        return asyncio.run(coro)
 
     async def start_session(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         chat_id = str(update.effective_message.chat_id)
@@ -53,77 +312,391 @@ class TelegramBot:
         self.active_sessions[chat_id] = {"status": "initialized"}
         await update.message.reply_text(
             "Welcome! Please send me the URL(s) of the light novel(s) you want to download. "
-            "You can send multiple URLs, each on a new line."
+            "You can send multiple URLs, each on a new line. "
+            "Add 'updates' after a URL to only get the chapters published since your last download, "
+            "or a range like '300-400' or 'last 50' to only get those chapters."
         )
         return "handle_urls"
 
     async def handle_urls(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         chat_id = str(update.effective_message.chat_id)
-        urls = update.message.text.strip().splitlines()
+        lines = update.message.text.strip().splitlines()
         
-        valid_urls = [url for url in urls if re.match(r'https?://[^\s]+', url)]
-        if not valid_urls:
+        try:
+            novel_requests = [self.parse_request_line(line) for line in lines]
+        except ValueError as e:
+            await update.message.reply_text(str(e))
+            return "handle_urls"
+        novel_requests = [request for request in novel_requests if request]
+        if not novel_requests:
             await update.message.reply_text("Please provide at least one valid URL.")
             return "handle_urls"
 
-        await update.message.reply_text(f"Processing {len(valid_urls)} novel(s). This may take a while...")
+        if self.job_queue:
+            await self.enqueue_jobs(update, chat_id, novel_requests)
+            return ConversationHandler.END
+
+        await update.message.reply_text(f"Processing {len(novel_requests)} novel(s). This may take a while...")
 
         loop = asyncio.get_event_loop()
-        for url in valid_urls:
+        for url, options in novel_requests:
+            with self.jobs_waiting_lock:
+                self.jobs_waiting += 1
             # We pass the bot instance and context to the processing function
-            loop.run_in_executor(self.executor, self.process_single_url, url, chat_id, self.application.bot)
+            loop.run_in_executor(self.executor, self.run_waiting_job, url, chat_id, self.application.bot, options)
         
         return ConversationHandler.END
 
-    def process_single_url(self, url, chat_id, bot):
+    async def enqueue_jobs(self, update, chat_id, novel_requests):
+        priority = 1 if chat_id in self.priority_chats else 0
+        loop = asyncio.get_event_loop()
+
+        def enqueue():
+            job_ids = [
+                self.job_queue.enqueue(chat_id, url, options, priority=priority)
+                for url, options in novel_requests
+            ]
+            return self.job_queue.position(job_ids[0])
+
+        position = await loop.run_in_executor(None, enqueue)
+        # The web process doesn't run the jobs itself, so the session ends here
+        self.active_sessions.pop(chat_id, None)
+        await update.message.reply_text(
+            f"Queued {len(novel_requests)} novel(s). "
+            f"There are {position} job(s) ahead of yours. This may take a while..."
+        )
+
+    async def show_queue(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if not self.job_queue:
+            await update.message.reply_text(
+                f"{len(self.active_sessions)} active session(s), "
+                f"{self.jobs_waiting} job(s) waiting."
+            )
+            return
+        stats = await asyncio.get_event_loop().run_in_executor(None, self.job_queue.stats)
+        await update.message.reply_text(
+            f"Queued: {stats['queued']}, running: {stats['running']}\n"
+            f"Oldest queued job has waited {stats['oldest_wait'] / 60:.0f} min, "
+            f"average wait in the last hour: {stats['average_wait'] / 60:.0f} min."
+        )
+
+    def parse_request_line(self, line):
+        """
+        Parses a line like "<url> [updates] [300-400 | last 50]" into
+        (url, options). Returns None if the line doesn't start with a URL,
+        and raises ValueError if what follows it can't be understood.
+        """
+        parts = line.split()
+        if not parts or not re.match(r'https?://[^\s]+', parts[0]):
+            return None
+        options = {"updates_only": "updates" in (part.lower() for part in parts[1:])}
+        range_text = " ".join(part for part in parts[1:] if part.lower() != "updates")
+        if range_text:
+            chapter_range = ChapterRange.parse(range_text)
+            if not chapter_range:
+                raise ValueError(
+                    f"Couldn't understand '{range_text}' after {parts[0]}. "
+                    "Give chapters like '300-400', '300-' or 'last 50'."
+                )
+            options["range"] = str(chapter_range)
+        return parts[0], options
+
+    def run_waiting_job(self, url, chat_id, bot, options=None):
+        """Runs a job queued on the executor by handle_urls."""
+        with self.jobs_waiting_lock:
+            self.jobs_waiting -= 1
+        self.process_single_url(url, chat_id, bot, options)
+
+    def process_single_url(self, url, chat_id, bot, options=None):
         """This function runs in a separate thread."""
+        options = options or {}
+        broadcast = Broadcast(self.get_dispatcher(bot), chat_id)
+        started = time.perf_counter()
+        parser = builder = checkpoint = output_dir = None
+        outcome = "error"
         try:
-            parser = self.source_manager.get_parser(url)
+            chapter_range = ChapterRange.parse(options.get("range", ""))
+            parser = self.source_manager.get_parser(url, database=self.database, chapter_range=chapter_range)
             if not parser:
-                asyncio.run(bot.send_message(chat_id, text=f"Sorry, the URL {url} is not supported yet."))
+                broadcast.send_message(f"Sorry, the URL {url} is not supported yet.")
+                outcome = "unsupported"
                 return
 
-            asyncio.run(bot.send_message(chat_id, text=f"Scraping '{url}'..."))
-            parser.read_novel_info()
+            delivered = set(self.get_delivered_chapters(chat_id, url))
+
+            # Full downloads of the same novel and chapters share one crawl
+            if not options.get("updates_only"):
+                flight = self.crawls.join(self.crawl_key(url, options), chat_id)
+                if flight is None:
+                    broadcast.send_message(
+                        f"'{url}' is already being downloaded for someone else. "
+                        "You'll get the same updates and e-book."
+                    )
+                    outcome = "joined"
+                    return
+                broadcast.flight = flight
+
+            broadcast.set_status(f"Scraping '{url}'...")
+            checkpoint = self.open_checkpoint(url, chat_id, options, shared=bool(broadcast.flight))
+            if checkpoint and checkpoint.restore(parser):
+                # An earlier attempt was interrupted; carry on from where it got to
+                broadcast.resume(checkpoint.file_ids, checkpoint.chats)
+                broadcast.set_status(
+                    f"Resuming '{parser.novel_title}': {len(checkpoint.done)} chapters and "
+                    f"{len(checkpoint.file_ids)} volumes were done before it was interrupted."
+                )
+            else:
+                # A returning reader wants the current chapter list, not a cached one
+                parser.read_novel_info(refresh=bool(delivered))
 
             if not parser.chapters:
-                asyncio.run(bot.send_message(chat_id, text=f"Could not find any chapters for '{parser.novel_title}'."))
+                broadcast.send_message(f"Could not find any chapters for '{parser.novel_title}'.")
+                outcome = "empty"
                 return
-            
-            asyncio.run(bot.send_message(chat_id, text=f"Found {len(parser.chapters)} chapters for '{parser.novel_title}'. Downloading..."))
-            
-            # Download chapter bodies (this part can be slow)
-            for chapter in parser.chapters:
-                try:
-                    chapter['body'] = parser.download_chapter_body(chapter['url'])
-                except Exception as e:
-                    logger.error(f"Failed to download chapter {chapter['url']}: {e}")
-                    chapter['body'] = "<p><i>Chapter content could not be downloaded.</i></p>"
 
-            asyncio.run(bot.send_message(chat_id, text=f"Building e-book for '{parser.novel_title}'..."))
-            
-            builder = EbookBuilder()
-            # Sanitize the filename to remove characters that are invalid in file names
-            safe_title = re.sub(r'[\\/*?:"<>|]', "", parser.novel_title)
-            output_filename = f"{safe_title}.epub"
+            chapters = parser.selected_chapters()
+            if not chapters:
+                broadcast.send_message(
+                    f"'{parser.novel_title}' has no chapters in {chapter_range} "
+                    f"(it has {len(parser.chapters)})."
+                )
+                outcome = "empty"
+                return
+
+            book_title = parser.novel_title
+            if chapter_range:
+                book_title = f"{parser.novel_title} (ch. {chapters[0]['id']}\u2013{chapters[-1]['id']})"
+            stored_urls = set()
+            if delivered and options.get("updates_only"):
+                new_chapters = [c for c in chapters if normalize_url(c['url']) not in delivered]
+                if not new_chapters:
+                    broadcast.send_message(f"No new chapters for '{parser.novel_title}' since your last download.")
+                    outcome = "up_to_date"
+                    return
+                chapters = new_chapters
+                book_title = f"{parser.novel_title} (ch. {new_chapters[0]['id']}\u2013{new_chapters[-1]['id']})"
+                broadcast.set_status(f"Found {len(new_chapters)} new chapters for '{parser.novel_title}'. Downloading...")
+            else:
+                # Previously delivered chapters come from stored bodies
+                stored_urls = {c['url'] for c in chapters if normalize_url(c['url']) in delivered}
+                broadcast.set_status(f"Found {len(chapters)} chapters for '{parser.novel_title}'. Downloading...")
             
-            builder.build(
-                title=parser.novel_title,
+            digest = ArtifactCache.digest(
+                BUILDER_VERSION,
+                book_title,
+                chapters,
+                max_chapters=self.max_volume_chapters,
+                max_bytes=self.max_volume_bytes,
+                compress_level=self.compress_level,
+            )
+            if not broadcast.file_ids and self.send_cached_book(broadcast, url, digest):
+                self.record_delivery(broadcast.finish(), url, chapters)
+                outcome = "cached"
+                return
+
+            if checkpoint:
+                checkpoint.start(parser)
+            # Volumes sent before an interruption aren't built again; the
+            # book carries on from the chapter after the last of them
+            sent_volumes = checkpoint.volumes if checkpoint else []
+            remaining = chapters
+            if sent_volumes:
+                remaining = [c for c in chapters if c['id'] > sent_volumes[-1]['last_chapter']]
+            builder = EbookBuilder(compress_threads=self.compress_threads, compress_level=self.compress_level)
+            # Each chapter goes into the book as soon as it's downloaded, and each
+            # volume is sent as soon as it's full (this part can be slow)
+            # Jobs for the same book can run at once, so each builds in its own directory
+            output_dir = tempfile.mkdtemp(prefix="lncrawl-")
+            volumes = builder.build_volumes(
+                title=book_title,
                 author=parser.novel_author,
                 cover_url=parser.novel_cover,
-                chapters=parser.chapters,
-                output_path=output_filename
+                chapters=parser.iter_chapters(
+                    remaining,
+                    concurrency=self.chapter_concurrency,
+                    window=self.chapter_window,
+                    on_progress=lambda done, total: broadcast.show_progress(book_title, done, total),
+                    stored_urls=stored_urls,
+                    checkpoint=checkpoint,
+                ),
+                max_chapters=self.max_volume_chapters,
+                max_bytes=self.max_volume_bytes,
+                output_dir=output_dir,
+                first_volume=len(sent_volumes) + 1,
             )
+            built = [
+                {"title": volume['title'], "path": self.artifacts.local_path(digest, index) if self.artifacts else None}
+                for index, volume in enumerate(sent_volumes)
+            ]
+            # Chats that joined meanwhile get the volumes sent so far
+            broadcast.chats()
+            for output_filename, volume_title, last_chapter in volumes:
+                try:
+                    broadcast.send_document(output_filename, thumbnail=builder.cover_thumbnail)
+                    sent_volumes.append({
+                        "file_id": broadcast.file_ids[-1],
+                        "title": volume_title,
+                        "last_chapter": last_chapter,
+                    })
+                    if checkpoint:
+                        checkpoint.volume_sent(sent_volumes, broadcast.volumes_sent)
+                finally:
+                    path = self.keep_built_volume(output_filename, digest, len(built))
+                built.append({"title": volume_title, "path": path})
+            # A book with missing chapters is built again next time, to retry them
+            if not parser.failed_urls:
+                self.save_cached_book(url, digest, built, broadcast.file_ids)
+
+            cache = get_chapter_cache()
+            if cache:
+                logger.info(f"Chapter cache stats: {cache.stats()}")
 
-            asyncio.run(bot.send_document(chat_id, document=open(output_filename, 'rb')))
-            os.remove(output_filename) # Clean up the file after sending
+            self.record_delivery(broadcast.finish(), url, chapters, parser.failed_urls)
+            outcome = "built"
 
+        except HostUnavailableError as e:
+            logger.error(f"Gave up on {url}: {e}")
+            broadcast.send_message(
+                f"The site of {url} is refusing requests for now. Please try again later; "
+                "the chapters downloaded so far are kept."
+            )
         except Exception as e:
             logger.error(f"Failed to process {url}: {e}", exc_info=True)
-            asyncio.run(bot.send_message(chat_id, text=f"An unexpected error occurred while processing {url}."))
+            broadcast.send_message(f"An unexpected error occurred while processing {url}.")
         finally:
+            if broadcast.flight:
+                broadcast.finish()
+            broadcast.end_status()
+            if checkpoint:
+                # Only an unfinished crawl is worth resuming
+                if outcome == "error":
+                    checkpoint.flush()
+                else:
+                    checkpoint.clear()
+            if output_dir:
+                shutil.rmtree(output_dir, ignore_errors=True)
             if chat_id in self.active_sessions:
                 del self.active_sessions[chat_id]
+            self.log_job_summary(url, outcome, started, parser, builder, broadcast)
+
+    def log_job_summary(self, url, outcome, started, parser, builder, broadcast):
+        """Records the job in the metrics and logs where its time went."""
+        elapsed = time.perf_counter() - started
+        metrics.JOB_SECONDS.observe(elapsed, outcome=outcome)
+        metrics.JOBS.inc(outcome=outcome)
+        stats = parser.stats if parser else {}
+        logger.info(
+            f"Job {outcome} for {url} in {elapsed:.1f}s: "
+            f"toc {stats.get('toc_seconds', 0):.1f}s"
+            f"{' (stored)' if stats.get('toc_stored') else ''}, "
+            f"{stats.get('downloaded', 0)} downloaded, "
+            f"{stats.get('cached', 0) + stats.get('stored', 0)} from cache, "
+            f"{stats.get('revalidated', 0)} revalidated, "
+            f"{stats.get('resumed', 0)} resumed, "
+            f"{stats.get('failed', 0)} failed, "
+            f"{stats.get('requests', 0)} requests / {stats.get('bytes', 0) / 1024 / 1024:.1f} MB "
+            f"in {stats.get('fetch_seconds', 0):.1f}s, "
+            f"parse {stats.get('parse_seconds', 0):.1f}s, "
+            f"build {builder.build_seconds if builder else 0:.1f}s, "
+            f"upload {broadcast.upload_seconds:.1f}s"
+        )
+
+    def open_checkpoint(self, url, chat_id, options, shared):
+        """
+        Gets the checkpoint of this crawl. A shared first-time crawl is the
+        same for everyone, so it is keyed by the novel alone; other crawls
+        depend on what the chat already has.
+        """
+        if not self.database:
+            return None
+        key = self.crawl_key(url, options)
+        if not shared:
+            key += f" chat:{chat_id} {'updates' if options.get('updates_only') else 'full'}"
+        return CrawlCheckpoint(self.database, key)
+
+    def crawl_key(self, url, options):
+        """Identifies the crawl of `url`: the novel, and the chapters wanted."""
+        key = normalize_url(url)
+        if options.get("range"):
+            key += f" chapters:{options['range']}"
+        return key
+
+    def send_cached_book(self, broadcast, url, digest):
+        """Answers from a previously built book. Returns False on a miss."""
+        if not self.artifacts:
+            return False
+        try:
+            volumes = self.artifacts.get(url, digest)
+        except Exception as e:
+            logger.error(f"Failed to read the artifact cache for {url}: {e}")
+            return False
+        if not volumes:
+            return False
+        sent = broadcast.send_cached([volume['file_id'] for volume in volumes])
+        if sent == len(volumes):
+            return True
+        if not all(volume['path'] for volume in volumes[sent:]):
+            # The book is built and sent again from the start
+            broadcast.resume([], list(broadcast.volumes_sent))
+            return False
+        # The other file ids were rejected, so upload the local copies instead
+        for volume in volumes[sent:]:
+            broadcast.send_document(volume['path'])
+        self.save_cached_book(url, digest, volumes, broadcast.file_ids)
+        return True
+
+    def keep_built_volume(self, path, digest, index):
+        """Keeps a local copy if configured, otherwise cleans up the file after sending."""
+        if self.artifacts:
+            return self.artifacts.keep_local(path, digest, index)
+        os.remove(path)
+        return None
+
+    def save_cached_book(self, url, digest, volumes, file_ids):
+        if not self.artifacts or len(file_ids) != len(volumes):
+            return
+        try:
+            self.artifacts.put(url, digest, [
+                {"file_id": file_id, "title": volume['title'], "path": volume['path']}
+                for volume, file_id in zip(volumes, file_ids)
+            ])
+        except Exception as e:
+            logger.error(f"Failed to record the built book for {url}: {e}")
+
+    def get_delivered_chapters(self, chat_id, url):
+        if not self.database:
+            return []
+        try:
+            return self.database.get_delivered_chapters(chat_id, url)
+        except Exception as e:
+            logger.error(f"Failed to read deliveries for {url}: {e}")
+            return []
+
+    def record_delivery(self, chat_ids, url, chapters, failed_urls=()):
+        """
+        Adds `chapters` to what each chat has received of the novel, except
+        the ones that failed, so that 'updates' retries them.
+        """
+        received = {c['url'] for c in chapters if c['url'] not in failed_urls}
+        for chat_id in chat_ids:
+            delivered = set(self.get_delivered_chapters(chat_id, url))
+            self.save_delivered_chapters(chat_id, url, delivered | received)
+
+    def save_delivered_chapters(self, chat_id, url, chapter_urls):
+        if not self.database:
+            return
+        try:
+            self.database.save_delivered_chapters(chat_id, url, chapter_urls)
+        except Exception as e:
+            logger.error(f"Failed to record delivery for {url}: {e}")
+
+    def report_failed_job(self, job):
+        """Tells the chat that a queued job was given up on."""
+        future = self.get_dispatcher(self.application.bot).send_message(
+            job['chat_id'],
+            f"Sorry, downloading {job['url']} kept failing and was given up. Please try again later.",
+        )
+        future.add_done_callback(_log_failure)
 
     async def cancel_session(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         chat_id = str(update.effective_message.chat_id)
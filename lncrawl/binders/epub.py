@@ -1,68 +1,278 @@
+import io
+import logging
 import os
 import re
+import time
 import uuid
 import zipfile
-import requests
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from PIL import Image
-from io import BytesIO
-from xml.dom.minidom import parseString, Document
+from functools import lru_cache
+from xml.sax.saxutils import escape, quoteattr
+
+from lncrawl.core import metrics
+from lncrawl.core.covers import get_cover_cache
+
+logger = logging.getLogger(__name__)
 
 # Absolute path to the assets directory
 ASSETS_PATH = os.path.join(os.path.dirname(__file__), '..', 'assets', 'epub')
 
+# Bump whenever the output changes, so cached books are rebuilt
+BUILDER_VERSION = "2"
+
+def safe_filename(title):
+    """Removes characters that are invalid in file names."""
+    return re.sub(r'[\\/*?:"<>|]', "", title)
+
+def deflate(data, level):
+    """Compresses an entry the way zipfile does. zlib releases the GIL."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return len(data), zlib.crc32(data), compressor.compress(data) + compressor.flush()
+
+# The ZipFile internals that `write_deflated` relies on
+_ZIPFILE_INTERNALS = ("_lock", "_writecheck", "_didModify", "start_dir", "fp", "filelist", "NameToInfo")
+
+def write_deflated(archive, name, size, crc, data):
+    """
+    Appends an entry deflated by `deflate` to an archive opened for writing.
+    zipfile can only compress on its own, so the local header is written
+    here and the entry registered the way ZipFile.writestr does; with the
+    sizes and CRC known up front it needs no data descriptor, even on a
+    pipe. This uses ZipFile internals: check `deflated_writes_supported`
+    first.
+    """
+    zinfo = zipfile.ZipInfo(name, date_time=time.localtime(time.time())[:6])
+    zinfo.compress_type = zipfile.ZIP_DEFLATED
+    zinfo.external_attr = 0o600 << 16
+    zinfo.file_size = size
+    zinfo.compress_size = len(data)
+    zinfo.CRC = crc
+    with archive._lock:
+        zinfo.header_offset = archive.fp.tell()
+        archive._writecheck(zinfo)
+        archive._didModify = True
+        archive.fp.write(zinfo.FileHeader())
+        archive.fp.write(data)
+        archive.start_dir = archive.fp.tell()
+        archive.filelist.append(zinfo)
+        archive.NameToInfo[name] = zinfo
+
+@lru_cache(maxsize=None)
+def deflated_writes_supported():
+    """
+    Whether `write_deflated` works with this Python's zipfile. A small
+    archive is written with it in memory and read back: it has to pass
+    `testzip`, keep the stored mimetype first and return the same content.
+    """
+    body = b'<html>' + b'round trip ' * 100 + b'</html>'
+    try:
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            if not all(hasattr(archive, attribute) for attribute in _ZIPFILE_INTERNALS):
+                raise AttributeError("zipfile internals have changed")
+            archive.writestr('mimetype', 'application/epub+zip', compress_type=zipfile.ZIP_STORED)
+            write_deflated(archive, 'chapter.xhtml', *deflate(body, zlib.Z_DEFAULT_COMPRESSION))
+            archive.writestr('after.xhtml', body)
+        with zipfile.ZipFile(buffer) as archive:
+            first = archive.infolist()[0]
+            if (archive.testzip() is not None
+                    or archive.namelist() != ['mimetype', 'chapter.xhtml', 'after.xhtml']
+                    or first.compress_type != zipfile.ZIP_STORED
+                    or archive.read('chapter.xhtml') != body
+                    or archive.read('after.xhtml') != body):
+                raise ValueError("the archive didn't read back the same")
+        return True
+    except Exception as e:
+        logger.warning(f"Compressing chapters on the building thread, zipfile can't take them pre-compressed: {e}")
+        return False
+
 class EbookBuilder:
-    def __init__(self):
+    def __init__(self, compress_threads=1, compress_level=None):
+        """
+        With `compress_threads` above 1, chapters are compressed in that many
+        threads and written, already compressed, in spine order. The
+        `compress_level` is the zlib level, 1 (fast) to 9 (small). The size
+        that `build_volumes` splits on then trails by the few chapters still
+        being compressed. If this Python's zipfile can't take pre-compressed
+        entries, chapters are compressed on the calling thread instead.
+        """
+        self.compress_threads = compress_threads
+        self.compress_level = compress_level
+        self.compressor = None
+        self.compressing = deque()
         self.toc = []
+        self.zip = None
+        self.bytes_written = 0
+        # Time spent writing the current volume, and all volumes so far
+        self.volume_seconds = 0.0
+        self.build_seconds = 0.0
+        self.cover_image = None
+        # Small JPEG of the cover for Telegram to show with the file
+        self.cover_thumbnail = None
 
     def build(self, title, author, cover_url, chapters, output_path):
         """
-        Builds the EPUB file.
+        Builds the EPUB file. `output_path` is either a file name or a
+        writable binary file-like object (e.g. BytesIO or a pipe). Entries
+        are written straight into the zip stream without temp files.
+        """
+        self.open(title, author, cover_url, output_path)
+        try:
+            for chapter in chapters:
+                self.add_chapter(chapter.get('title', ''), chapter.get('body', ''))
+        finally:
+            self.close()
+
+    def build_volumes(self, title, author, cover_url, chapters, output_dir='.', max_chapters=None, max_bytes=None,
+                      first_volume=1):
+        """
+        Builds the book as a series of volumes of at most `max_chapters`
+        chapters and roughly `max_bytes` bytes each. `chapters` is an iterable
+        of `(chapter, body)` pairs in order, such as the one returned by
+        `WebToEpubParser.iter_chapters`.
+
+        Yields `(output_path, volume_title, last_chapter_id)` as soon as each
+        volume is finished, so it can be sent while later chapters are
+        downloading. A book that fits in one volume keeps its plain title.
+        Numbering starts at `first_volume` when carrying on an earlier build.
+        """
+        iterator = iter(chapters)
+        pending = next(iterator, None)
+        volume = first_volume - 1
+        while pending is not None:
+            volume += 1
+            part_path = os.path.join(output_dir, f"{safe_filename(title)}.part{volume}.epub")
+            self.open(title, author, cover_url, part_path)
+            try:
+                first_id = last_id = None
+                count = 0
+                while pending is not None:
+                    chapter, body = pending
+                    count += 1
+                    self.add_chapter(chapter.get('title', ''), body)
+                    last_id = chapter.get('id', count)
+                    if first_id is None:
+                        first_id = last_id
+                    pending = next(iterator, None)
+                    if max_chapters and count >= max_chapters:
+                        break
+                    if max_bytes and self.bytes_written >= max_bytes:
+                        break
+                # The title is only known once the volume is full
+                if volume > 1 or pending is not None:
+                    self.novel_title = f"{title} Vol. {volume} (ch. {first_id}\u2013{last_id})"
+                self.close()
+            except Exception:
+                self.close()
+                os.remove(part_path)
+                raise
+            output_path = os.path.join(output_dir, f"{safe_filename(self.novel_title)}.epub")
+            os.replace(part_path, output_path)
+            yield output_path, self.novel_title, last_id
+
+    def open(self, title, author, cover_url, output_path):
+        """
+        Starts a book that chapters are then streamed into one at a time with
+        `add_chapter`. `close` writes the OPF and NCX and finishes the file.
         """
         self.novel_title = title
         self.novel_author = author
-        self.chapters = chapters
-        
-        # Create a temporary directory for book assets
-        self.temp_dir = os.path.join('temp_epub_build', str(uuid.uuid4()))
-        self.oebps_dir = os.path.join(self.temp_dir, 'OEBPS')
-        self.text_dir = os.path.join(self.oebps_dir, 'Text')
-        self.image_dir = os.path.join(self.oebps_dir, 'Images')
-        self.meta_inf_dir = os.path.join(self.temp_dir, 'META-INF')
-
-        os.makedirs(self.text_dir, exist_ok=True)
-        os.makedirs(self.image_dir, exist_ok=True)
-        os.makedirs(self.meta_inf_dir, exist_ok=True)
+        start = time.perf_counter()
+        self.toc = []
+        self.bytes_written = 0
+        self.volume_seconds = 0.0
 
+        with open(os.path.join(ASSETS_PATH, 'chapter.xhtml'), 'r', encoding='utf-8') as f:
+            self.chapter_template = f.read()
+
+        self.zip = zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=self.compress_level)
+        if self.compress_threads > 1 and deflated_writes_supported():
+            self.compressor = ThreadPoolExecutor(self.compress_threads, thread_name_prefix="deflate")
+        # mimetype must be the first entry and stored uncompressed
         self._create_mimetype()
         self._create_container_xml()
-        self._write_chapters()
         self._write_stylesheet()
-        cover_image_path = self._download_cover(cover_url)
-        
-        self._create_content_opf(cover_image_path)
-        self._create_toc_ncx()
-        
-        # Create the final ZIP file (EPUB)
-        with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as epub_zip:
-            # Write mimetype file first and uncompressed
-            epub_zip.write(os.path.join(self.temp_dir, 'mimetype'), 'mimetype', compress_type=zipfile.ZIP_STORED)
-            # Write the rest of the files
-            for root, _, files in os.walk(self.temp_dir):
-                for file in files:
-                    if file == 'mimetype':
-                        continue
-                    file_path = os.path.join(root, file)
-                    arcname = os.path.relpath(file_path, self.temp_dir)
-                    epub_zip.write(file_path, arcname)
-
-        # Clean up temporary files
-        import shutil
-        shutil.rmtree(self.temp_dir)
+        self.cover_filename = self._download_cover(cover_url)
+        self._add_time(start)
+
+    def add_chapter(self, title, body):
+        """Writes one chapter into the book; the body isn't kept afterwards."""
+        start = time.perf_counter()
+        i = len(self.toc)
+        filename = f"chapter_{i+1:04d}.xhtml"
+
+        # Simple template replacement
+        content = self.chapter_template.replace('{{title}}', title)
+        content = content.replace('{{{body}}}', body)
+
+        name = f'OEBPS/Text/{filename}'
+        if self.compressor:
+            level = zlib.Z_DEFAULT_COMPRESSION if self.compress_level is None else self.compress_level
+            self.compressing.append((name, self.compressor.submit(deflate, content.encode('utf-8'), level)))
+            # Keep the threads busy without holding on to the whole book
+            while len(self.compressing) > 2 * self.compress_threads:
+                self._write_compressed(*self.compressing.popleft())
+        else:
+            self._write_entry(name, content.encode('utf-8'))
+
+        self.toc.append({'id': f"chap_{i+1}", 'filename': filename, 'title': title})
+        self._add_time(start)
+
+    def close(self):
+        if self.zip is None:
+            return
+        start = time.perf_counter()
+        try:
+            while self.compressing:
+                self._write_compressed(*self.compressing.popleft())
+            self._create_content_opf(self.cover_filename)
+            self._create_toc_ncx()
+        finally:
+            if self.compressor:
+                self.compressing.clear()
+                self.compressor.shutdown(cancel_futures=True)
+                self.compressor = None
+            self.zip.close()
+            self.zip = None
+            self._add_time(start)
+            metrics.BUILD_SECONDS.observe(self.volume_seconds)
+
+    def _add_time(self, start):
+        elapsed = time.perf_counter() - start
+        self.volume_seconds += elapsed
+        self.build_seconds += elapsed
+
+    def _write_entry(self, name, data, compress_type=None):
+        self.zip.writestr(name, data, compress_type=compress_type)
+        # Compressed data plus the local header and central directory record
+        self.bytes_written += self.zip.filelist[-1].compress_size + 76 + 2 * len(name)
+
+    def _write_compressed(self, name, compressed):
+        """Writes an entry deflated by `deflate` in a compressor thread."""
+        size, crc, data = compressed.result()
+        write_deflated(self.zip, name, size, crc, data)
+        self.bytes_written += len(data) + 76 + 2 * len(name)
+
+    def _write_stream(self, name, chunks):
+        """Writes an entry from an iterable of text chunks without joining them first."""
+        with self.zip.open(name, 'w') as f:
+            buffer = []
+            size = 0
+            for chunk in chunks:
+                buffer.append(chunk)
+                size += len(chunk)
+                if size >= 64 * 1024:
+                    f.write(''.join(buffer).encode('utf-8'))
+                    buffer = []
+                    size = 0
+            f.write(''.join(buffer).encode('utf-8'))
+        self.bytes_written += self.zip.filelist[-1].compress_size + 76 + 2 * len(name)
 
     def _create_mimetype(self):
-        with open(os.path.join(self.temp_dir, 'mimetype'), 'w') as f:
-            f.write('application/epub+zip')
+        self._write_entry('mimetype', 'application/epub+zip', compress_type=zipfile.ZIP_STORED)
 
     def _create_container_xml(self):
         content = '''<?xml version="1.0" encoding="UTF-8"?>
@@ -71,188 +281,95 @@ class EbookBuilder:
     <rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>
   </rootfiles>
 </container>'''
-        with open(os.path.join(self.meta_inf_dir, 'container.xml'), 'w') as f:
-            f.write(content)
-
-    def _write_chapters(self):
-        with open(os.path.join(ASSETS_PATH, 'chapter.xhtml'), 'r', encoding='utf-8') as f:
-            template = f.read()
-
-        for i, chapter in enumerate(self.chapters):
-            filename = f"chapter_{i+1:04d}.xhtml"
-            chapter['filename'] = filename
-            
-            # Simple template replacement
-            content = template.replace('{{title}}', chapter.get('title', ''))
-            content = content.replace('{{{body}}}', chapter.get('body', ''))
-
-            with open(os.path.join(self.text_dir, filename), 'w', encoding='utf-8') as f:
-                f.write(content)
-            
-            self.toc.append({'id': f"chap_{i+1}", 'filename': filename, 'title': chapter.get('title', '')})
+        self._write_entry('META-INF/container.xml', content)
 
     def _write_stylesheet(self):
-        import shutil
-        shutil.copy(os.path.join(ASSETS_PATH, 'style.css'), self.oebps_dir)
+        with open(os.path.join(ASSETS_PATH, 'style.css'), 'rb') as f:
+            self._write_entry('OEBPS/style.css', f.read())
 
     def _download_cover(self, cover_url):
         if not cover_url:
             return None
+        cover_filename = "cover.jpg"
         try:
-            response = requests.get(cover_url, stream=True, timeout=30)
-            response.raise_for_status()
-            
-            image = Image.open(BytesIO(response.content))
-            
-            # Convert to JPG for compatibility
-            cover_filename = "cover.jpg"
-            save_path = os.path.join(self.image_dir, cover_filename)
-            
-            if image.mode in ("RGBA", "P"):
-                 image = image.convert("RGB")
-            
-            image.save(save_path, "JPEG")
-            return cover_filename
+            # Resized and recompressed once, then reused by later volumes and books
+            cover = get_cover_cache().get(cover_url)
         except Exception as e:
             print(f"Failed to download or process cover image: {e}")
             return None
+        self.cover_image = cover.image
+        self.cover_thumbnail = cover.thumbnail
+        self._write_entry(f'OEBPS/Images/{cover_filename}', self.cover_image)
+        return cover_filename
 
     def _create_content_opf(self, cover_filename):
-        doc = Document()
-        package = doc.createElement('package')
-        package.setAttribute('xmlns', 'http://www.idpf.org/2007/opf')
-        package.setAttribute('unique-identifier', 'bookid')
-        package.setAttribute('version', '2.0')
-        doc.appendChild(package)
+        if cover_filename:
+            with open(os.path.join(ASSETS_PATH, 'cover.xhtml'), 'r') as f:
+                cover_xhtml = f.read().replace('{{cover_path}}', f'../Images/{cover_filename}')
+            self._write_entry('OEBPS/Text/cover.xhtml', cover_xhtml.encode('utf-8'))
+        self._write_stream('OEBPS/content.opf', self._content_opf_lines(cover_filename))
+
+    def _content_opf_lines(self, cover_filename):
+        yield '<?xml version="1.0" encoding="utf-8"?>\n'
+        yield '<package xmlns="http://www.idpf.org/2007/opf" unique-identifier="bookid" version="2.0">\n'
 
         # METADATA
-        metadata = doc.createElement('metadata')
-        metadata.setAttribute('xmlns:dc', 'http://purl.org/dc/elements/1.1/')
-        metadata.setAttribute('xmlns:opf', 'http://www.idpf.org/2007/opf')
-        package.appendChild(metadata)
-        
-        # -- Title, Author, Date, ID
-        title_el = doc.createElement('dc:title')
-        title_el.appendChild(doc.createTextNode(self.novel_title))
-        metadata.appendChild(title_el)
-        
-        creator_el = doc.createElement('dc:creator')
-        creator_el.appendChild(doc.createTextNode(self.novel_author))
-        metadata.appendChild(creator_el)
-
-        date_el = doc.createElement('dc:date')
-        date_el.appendChild(doc.createTextNode(datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')))
-        metadata.appendChild(date_el)
-
-        id_el = doc.createElement('dc:identifier')
-        id_el.setAttribute('id', 'bookid')
-        id_el.appendChild(doc.createTextNode(str(uuid.uuid4())))
-        metadata.appendChild(id_el)
-        
-        # -- Cover
+        yield '  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:opf="http://www.idpf.org/2007/opf">\n'
+        yield f'    <dc:title>{escape(self.novel_title)}</dc:title>\n'
+        yield f'    <dc:creator>{escape(self.novel_author)}</dc:creator>\n'
+        yield f'    <dc:date>{datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")}</dc:date>\n'
+        yield f'    <dc:identifier id="bookid">{uuid.uuid4()}</dc:identifier>\n'
         if cover_filename:
-            meta_cover = doc.createElement('meta')
-            meta_cover.setAttribute('name', 'cover')
-            meta_cover.setAttribute('content', 'cover-image')
-            metadata.appendChild(meta_cover)
+            yield '    <meta name="cover" content="cover-image"/>\n'
+        yield '  </metadata>\n'
 
         # MANIFEST
-        manifest = doc.createElement('manifest')
-        package.appendChild(manifest)
-        
-        # -- Manifest items
-        self._add_manifest_item(doc, manifest, 'ncx', 'toc.ncx', 'application/x-dtbncx+xml')
-        self._add_manifest_item(doc, manifest, 'style', 'style.css', 'text/css')
+        yield '  <manifest>\n'
+        yield self._manifest_item('ncx', 'toc.ncx', 'application/x-dtbncx+xml')
+        yield self._manifest_item('style', 'style.css', 'text/css')
         if cover_filename:
-            self._add_manifest_item(doc, manifest, 'cover-image', f'Images/{cover_filename}', 'image/jpeg')
-            self._add_manifest_item(doc, manifest, 'cover-page', 'Text/cover.xhtml', 'application/xhtml+xml')
-            with open(os.path.join(ASSETS_PATH, 'cover.xhtml'), 'r') as f:
-                cover_xhtml = f.read().replace('{{cover_path}}', f'../Images/{cover_filename}')
-            with open(os.path.join(self.text_dir, 'cover.xhtml'), 'w') as f:
-                f.write(cover_xhtml)
-        
+            yield self._manifest_item('cover-image', f'Images/{cover_filename}', 'image/jpeg')
+            yield self._manifest_item('cover-page', 'Text/cover.xhtml', 'application/xhtml+xml')
         for chapter_info in self.toc:
-            self._add_manifest_item(doc, manifest, chapter_info['id'], f"Text/{chapter_info['filename']}", 'application/xhtml+xml')
+            yield self._manifest_item(chapter_info['id'], f"Text/{chapter_info['filename']}", 'application/xhtml+xml')
+        yield '  </manifest>\n'
 
         # SPINE
-        spine = doc.createElement('spine')
-        spine.setAttribute('toc', 'ncx')
-        package.appendChild(spine)
-        
+        yield '  <spine toc="ncx">\n'
         if cover_filename:
-            self._add_spine_item(doc, spine, 'cover-page')
-            
+            yield '    <itemref idref="cover-page"/>\n'
         for chapter_info in self.toc:
-            self._add_spine_item(doc, spine, chapter_info['id'])
+            yield f'    <itemref idref={quoteattr(chapter_info["id"])}/>\n'
+        yield '  </spine>\n'
 
         # GUIDE
         if cover_filename:
-            guide = doc.createElement('guide')
-            package.appendChild(guide)
-            ref = doc.createElement('reference')
-            ref.setAttribute('type', 'cover')
-            ref.setAttribute('title', 'Cover')
-            ref.setAttribute('href', 'Text/cover.xhtml')
-            guide.appendChild(ref)
-            
-        with open(os.path.join(self.oebps_dir, 'content.opf'), 'w', encoding='utf-8') as f:
-            f.write(doc.toprettyxml(indent='  '))
-
-    def _add_manifest_item(self, doc, manifest, item_id, href, media_type):
-        item = doc.createElement('item')
-        item.setAttribute('id', item_id)
-        item.setAttribute('href', href)
-        item.setAttribute('media-type', media_type)
-        manifest.appendChild(item)
-
-    def _add_spine_item(self, doc, spine, idref):
-        item = doc.createElement('itemref')
-        item.setAttribute('idref', idref)
-        spine.appendChild(item)
+            yield '  <guide>\n'
+            yield '    <reference type="cover" title="Cover" href="Text/cover.xhtml"/>\n'
+            yield '  </guide>\n'
+        yield '</package>\n'
+
+    def _manifest_item(self, item_id, href, media_type):
+        return f'    <item id={quoteattr(item_id)} href={quoteattr(href)} media-type={quoteattr(media_type)}/>\n'
 
     def _create_toc_ncx(self):
-        doc = Document()
-        ncx = doc.createElement('ncx')
-        ncx.setAttribute('xmlns', 'http://www.daisy.org/z3986/2005/ncx/')
-        ncx.setAttribute('version', '2005-1')
-        doc.appendChild(ncx)
-
-        head = doc.createElement('head')
-        ncx.appendChild(head)
-        self._add_meta(doc, head, 'dtb:uid', str(uuid.uuid4()))
-        self._add_meta(doc, head, 'dtb:depth', '1')
-
-        doc_title = doc.createElement('docTitle')
-        title_text = doc.createElement('text')
-        title_text.appendChild(doc.createTextNode(self.novel_title))
-        doc_title.appendChild(title_text)
-        ncx.appendChild(doc_title)
-        
-        nav_map = doc.createElement('navMap')
-        ncx.appendChild(nav_map)
-        
+        self._write_stream('OEBPS/toc.ncx', self._toc_ncx_lines())
+
+    def _toc_ncx_lines(self):
+        yield '<?xml version="1.0" encoding="utf-8"?>\n'
+        yield '<ncx xmlns="http://www.daisy.org/z3986/2005/ncx/" version="2005-1">\n'
+        yield '  <head>\n'
+        yield f'    <meta name="dtb:uid" content="{uuid.uuid4()}"/>\n'
+        yield '    <meta name="dtb:depth" content="1"/>\n'
+        yield '  </head>\n'
+        yield f'  <docTitle>\n    <text>{escape(self.novel_title)}</text>\n  </docTitle>\n'
+        yield '  <navMap>\n'
         for i, chapter_info in enumerate(self.toc):
-            nav_point = doc.createElement('navPoint')
-            nav_point.setAttribute('id', f"nav_{i+1}")
-            nav_point.setAttribute('playOrder', str(i+1))
-            
-            nav_label = doc.createElement('navLabel')
-            text_node = doc.createElement('text')
-            text_node.appendChild(doc.createTextNode(chapter_info['title']))
-            nav_label.appendChild(text_node)
-            nav_point.appendChild(nav_label)
-            
-            content = doc.createElement('content')
-            content.setAttribute('src', f"Text/{chapter_info['filename']}")
-            nav_point.appendChild(content)
-            
-            nav_map.appendChild(nav_point)
-
-        with open(os.path.join(self.oebps_dir, 'toc.ncx'), 'w', encoding='utf-8') as f:
-            f.write(doc.toprettyxml(indent='  '))
-
-    def _add_meta(self, doc, head, name, content):
-        meta = doc.createElement('meta')
-        meta.setAttribute('name', name)
-        meta.setAttribute('content', content)
-        head.appendChild(meta)
+            yield (
+                f'    <navPoint id="nav_{i+1}" playOrder="{i+1}">\n'
+                f'      <navLabel>\n        <text>{escape(chapter_info["title"])}</text>\n      </navLabel>\n'
+                f'      <content src={quoteattr("Text/" + chapter_info["filename"])}/>\n'
+                '    </navPoint>\n'
+            )
+        yield '  </navMap>\n'
+        yield '</ncx>\n'
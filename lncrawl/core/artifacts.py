@@ -0,0 +1,101 @@
+import hashlib
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+
+from lncrawl.core.urls import normalize_url
+
+logger = logging.getLogger(__name__)
+
+class ArtifactCache:
+    """
+    Records finished books by canonical novel URL and a digest of their
+    chapter list and build settings, together with the Telegram file ids
+    they were uploaded as. A hit can be answered by re-sending the file ids
+    without crawling, building or uploading anything.
+
+    Optionally keeps a local copy of every volume in `local_dir`, evicting
+    the least recently used files beyond `max_bytes`. Telegram file ids
+    only work for the bot that uploaded them, so the copies allow a
+    re-upload if a file id is rejected.
+    """
+    def __init__(self, database, local_dir=None, max_bytes=1024 * 1024 * 1024, ttl=30 * 24 * 3600):
+        self.artifacts = database.sync_db.artifacts
+        self.local_dir = local_dir
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        if local_dir:
+            os.makedirs(local_dir, exist_ok=True)
+
+    def ensure_indexes(self):
+        self.artifacts.create_index([("url", 1), ("digest", 1)], unique=True)
+        self.artifacts.create_index("last_used", expireAfterSeconds=self.ttl)
+
+    @staticmethod
+    def digest(builder_version, title, chapters, **settings):
+        """Hashes everything that determines the content of the built files."""
+        sha = hashlib.sha256()
+        sha.update(f"{builder_version}\0{title}\0{sorted(settings.items())}\0".encode('utf-8'))
+        for chapter in chapters:
+            sha.update(f"{chapter['url']}\0{chapter['title']}\0".encode('utf-8'))
+        return sha.hexdigest()
+
+    def get(self, novel_url, digest):
+        """Returns the list of volumes `{file_id, title, path}` or None."""
+        record = self.artifacts.find_one_and_update(
+            {"url": normalize_url(novel_url), "digest": digest},
+            {"$set": {"last_used": datetime.now(timezone.utc)}},
+        )
+        if not record:
+            return None
+        for volume in record["volumes"]:
+            path = volume.get("path")
+            if path and os.path.exists(path):
+                os.utime(path)
+            else:
+                volume["path"] = None
+        return record["volumes"]
+
+    def put(self, novel_url, digest, volumes):
+        now = datetime.now(timezone.utc)
+        self.artifacts.update_one(
+            {"url": normalize_url(novel_url), "digest": digest},
+            {"$set": {"volumes": volumes, "created_at": now, "last_used": now}},
+            upsert=True,
+        )
+
+    def local_path(self, digest, index):
+        """Returns the local copy of a volume kept earlier, or None."""
+        if not self.local_dir:
+            return None
+        path = os.path.join(self.local_dir, f"{digest}-{index}.epub")
+        return path if os.path.exists(path) else None
+
+    def keep_local(self, path, digest, index):
+        """
+        Moves a built volume into the local store and returns its new path,
+        or deletes it and returns None if there is no local store.
+        """
+        if not self.local_dir:
+            os.remove(path)
+            return None
+        target = os.path.join(self.local_dir, f"{digest}-{index}.epub")
+        os.replace(path, target)
+        self._evict()
+        return target
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.local_dir):
+                path = os.path.join(self.local_dir, name)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                os.remove(path)
+                total -= size
@@ -0,0 +1,150 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from lncrawl.core.urls import normalize_url
+
+logger = logging.getLogger(__name__)
+
+class ChapterCache:
+    """
+    Persistent SQLite cache of cleaned chapter bodies keyed by normalized
+    chapter URL. Entries younger than `ttl` seconds are served without any
+    network; older ones are revalidated with ETag/Last-Modified by the
+    parser. The total body size is kept under `max_bytes` by evicting the
+    least recently used entries.
+    """
+    def __init__(self, path, max_bytes=512 * 1024 * 1024, ttl=7 * 24 * 3600):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chapters ("
+            " url TEXT PRIMARY KEY,"
+            " body TEXT NOT NULL,"
+            " etag TEXT,"
+            " last_modified TEXT,"
+            " fetched_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL,"
+            " size INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chapters_accessed_at ON chapters (accessed_at)")
+        self._conn.commit()
+
+    def get(self, url, allow_stale=False):
+        """
+        Returns the cached entry for `url` as a dict with `body`, `etag`,
+        `last_modified`, `fetched_at` and `fresh`, or None. With
+        `allow_stale` a stale entry also counts as a hit.
+        """
+        key = normalize_url(url)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body, etag, last_modified, fetched_at FROM chapters WHERE url = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE chapters SET accessed_at = ? WHERE url = ?", (now, key))
+            self._conn.commit()
+        body, etag, last_modified, fetched_at = row
+        fresh = now - fetched_at < self.ttl
+        if fresh or allow_stale:
+            with self._lock:
+                self.hits += 1
+        return {
+            "body": body,
+            "etag": etag,
+            "last_modified": last_modified,
+            "fetched_at": fetched_at,
+            "fresh": fresh,
+        }
+
+    def put(self, url, body, etag=None, last_modified=None):
+        """Stores a freshly downloaded body, which counts as a cache miss."""
+        key = normalize_url(url)
+        now = time.time()
+        with self._lock:
+            self.misses += 1
+            self._conn.execute(
+                "INSERT OR REPLACE INTO chapters (url, body, etag, last_modified, fetched_at, accessed_at, size)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, body, etag, last_modified, now, now, len(body.encode('utf-8'))),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def touch(self, url):
+        """Marks an entry as freshly validated, e.g. after a 304 response."""
+        now = time.time()
+        with self._lock:
+            self.revalidated += 1
+            self._conn.execute(
+                "UPDATE chapters SET fetched_at = ?, accessed_at = ? WHERE url = ?",
+                (now, now, normalize_url(url)),
+            )
+            self._conn.commit()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM chapters").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Evict down to 90% so we don't run this on every single insert
+        target = self.max_bytes * 0.9
+        removed = 0
+        rows = self._conn.execute("SELECT url, size FROM chapters ORDER BY accessed_at").fetchall()
+        for url, size in rows:
+            if total <= target:
+                break
+            self._conn.execute("DELETE FROM chapters WHERE url = ?", (url,))
+            total -= size
+            removed += 1
+        logger.info(f"Evicted {removed} chapters from the cache")
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM chapters"
+            ).fetchone()
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidated": self.revalidated,
+                "entries": entries,
+                "bytes": size,
+            }
+
+_chapter_cache_instance = None
+_chapter_cache_lock = threading.Lock()
+
+def get_chapter_cache():
+    """
+    Gets the single instance of the ChapterCache, configured from the
+    CHAPTER_CACHE_PATH, CHAPTER_CACHE_MAX_MB and CHAPTER_CACHE_TTL environment
+    variables. Returns None if CHAPTER_CACHE_PATH is set to an empty string.
+    """
+    global _chapter_cache_instance
+    if _chapter_cache_instance is None:
+        path = os.getenv("CHAPTER_CACHE_PATH", os.path.join("cache", "chapters.sqlite3"))
+        if not path:
+            return None
+        with _chapter_cache_lock:
+            if _chapter_cache_instance is None:
+                _chapter_cache_instance = ChapterCache(
+                    path,
+                    max_bytes=int(os.getenv("CHAPTER_CACHE_MAX_MB", "512")) * 1024 * 1024,
+                    ttl=int(os.getenv("CHAPTER_CACHE_TTL", str(7 * 24 * 3600))),
+                )
+    return _chapter_cache_instance
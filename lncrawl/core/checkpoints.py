@@ -0,0 +1,130 @@
+import logging
+import threading
+import time
+
+from lncrawl.core.urls import normalize_url
+
+logger = logging.getLogger(__name__)
+
+class CrawlCheckpoint:
+    """
+    Saves the progress of a crawl as it goes: the novel info and chapter
+    list, every chapter body downloaded, and the volumes already sent. A job
+    that is retried, or requested again, after a crash or restart picks up
+    from there instead of starting over. Bodies are written in batches of
+    `flush_every`, or every `flush_interval` seconds.
+
+    Failing to read or write a checkpoint never fails the crawl itself.
+    """
+    def __init__(self, database, key, flush_every=20, flush_interval=5.0):
+        self.database = database
+        self.key = key
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.saved = None
+        self.done = set()
+        self.pending = {}
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+
+    def load(self):
+        """Returns the saved checkpoint, or None if this crawl is new."""
+        try:
+            self.saved = self.database.get_checkpoint(self.key)
+            if self.saved:
+                self.done = self.database.get_checkpoint_chapter_urls(self.key)
+        except Exception as e:
+            logger.warning(f"Could not read checkpoint {self.key}: {e}")
+            self.saved = None
+        return self.saved
+
+    def restore(self, parser):
+        """Puts the saved novel info back on `parser`. Returns False if there is none."""
+        if not self.load():
+            return False
+        parser.novel_title = self.saved['title']
+        parser.novel_author = self.saved['author']
+        parser.novel_cover = self.saved['cover']
+        parser.chapters = [dict(chapter) for chapter in self.saved['chapters']]
+        return True
+
+    def start(self, parser):
+        """Saves the novel info and chapter list the crawl is working from."""
+        self._save(
+            url=parser.novel_url,
+            title=parser.novel_title,
+            author=parser.novel_author,
+            cover=parser.novel_cover,
+            chapters=[
+                {"id": c['id'], "title": c['title'], "url": c['url']}
+                for c in parser.chapters
+            ],
+        )
+
+    def body(self, chapter):
+        """Returns the saved body of a chapter, or None."""
+        if normalize_url(chapter['url']) not in self.done:
+            return None
+        try:
+            return self.database.get_checkpoint_body(self.key, chapter['url'])
+        except Exception as e:
+            logger.warning(f"Could not read checkpoint {self.key}: {e}")
+            return None
+
+    def add(self, chapter, body):
+        with self.lock:
+            self.pending[chapter['url']] = body
+            due = (
+                len(self.pending) >= self.flush_every
+                or time.monotonic() - self.last_flush >= self.flush_interval
+            )
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            bodies, self.pending = self.pending, {}
+            self.last_flush = time.monotonic()
+        if not bodies:
+            return
+        try:
+            self.database.save_checkpoint_bodies(self.key, bodies)
+            self.done.update(normalize_url(url) for url in bodies)
+        except Exception as e:
+            logger.warning(f"Could not save checkpoint {self.key}: {e}")
+
+    @property
+    def volumes(self):
+        """The volumes sent so far, as `{file_id, title, last_chapter}`."""
+        return [dict(volume) for volume in self.saved.get('volumes', [])] if self.saved else []
+
+    @property
+    def file_ids(self):
+        return [volume['file_id'] for volume in self.volumes]
+
+    @property
+    def chats(self):
+        return list(self.saved.get('chats', [])) if self.saved else []
+
+    def volume_sent(self, volumes, chats):
+        """
+        Records the volumes uploaded so far and the chats that have them.
+        Each volume's last chapter is where a resumed build carries on from,
+        as the volumes rebuilt from there might not split the same way.
+        """
+        self._save(volumes=list(volumes), chats=list(chats))
+
+    def clear(self):
+        """Forgets the checkpoint once the crawl has been delivered."""
+        with self.lock:
+            self.pending = {}
+        try:
+            self.database.delete_checkpoint(self.key)
+        except Exception as e:
+            logger.warning(f"Could not delete checkpoint {self.key}: {e}")
+
+    def _save(self, **fields):
+        try:
+            self.database.save_checkpoint(self.key, **fields)
+        except Exception as e:
+            logger.warning(f"Could not save checkpoint {self.key}: {e}")
@@ -0,0 +1,119 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+from PIL import Image
+
+from lncrawl.core.http import get_session
+
+logger = logging.getLogger(__name__)
+
+# Telegram wants document thumbnails as JPEGs of at most 320x320 and 200 kB
+THUMBNAIL_SIZE = 320
+
+class Cover:
+    def __init__(self, image, thumbnail, width, height):
+        self.image = image
+        self.thumbnail = thumbnail
+        self.width = width
+        self.height = height
+
+    @property
+    def size(self):
+        return len(self.image) + len(self.thumbnail)
+
+def encode_jpeg(image, quality, max_bytes=None, min_quality=40):
+    """
+    Encodes `image` as a JPEG at `quality`, lowering the quality and then
+    the dimensions until it fits in `max_bytes`.
+    """
+    while True:
+        buffer = BytesIO()
+        image.save(buffer, "JPEG", quality=quality, optimize=True)
+        data = buffer.getvalue()
+        if not max_bytes or len(data) <= max_bytes or min(image.size) <= 64:
+            return data
+        if quality > min_quality:
+            quality = max(min_quality, quality - 10)
+        else:
+            image = image.resize((image.width * 3 // 4, image.height * 3 // 4), Image.LANCZOS)
+
+def process_cover(content, max_size=1600, quality=85, max_bytes=None):
+    """
+    Turns a downloaded cover into a JPEG no larger than `max_size` pixels on
+    either side (and `max_bytes` bytes, if given) and a thumbnail.
+    """
+    image = Image.open(BytesIO(content))
+    # Lets the JPEG decoder skip straight to a smaller scale
+    image.draft("RGB", (max_size, max_size))
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    image.thumbnail((max_size, max_size), Image.LANCZOS)
+
+    thumbnail = image.copy()
+    thumbnail.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.LANCZOS)
+    return Cover(
+        image=encode_jpeg(image, quality, max_bytes),
+        thumbnail=encode_jpeg(thumbnail, 80, 200 * 1024),
+        width=image.width,
+        height=image.height,
+    )
+
+class CoverCache:
+    """
+    Processed covers by URL, so a book that is built again, or split into
+    volumes, doesn't download and re-encode its cover each time. The least
+    recently used covers are dropped beyond `max_bytes`.
+    """
+    def __init__(self, max_bytes=32 * 1024 * 1024, max_size=1600, quality=85, max_image_bytes=None):
+        self.max_bytes = max_bytes
+        self.max_size = max_size
+        self.quality = quality
+        self.max_image_bytes = max_image_bytes
+        self.covers = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, url):
+        """Returns the processed cover at `url`, downloading it if needed."""
+        with self.lock:
+            cover = self.covers.get(url)
+            if cover:
+                self.covers.move_to_end(url)
+                return cover
+
+        response = get_session().get(url, timeout=30)
+        response.raise_for_status()
+        cover = process_cover(response.content, self.max_size, self.quality, self.max_image_bytes)
+
+        with self.lock:
+            if url not in self.covers:
+                self.covers[url] = cover
+                self.size += cover.size
+            while self.size > self.max_bytes and len(self.covers) > 1:
+                _, evicted = self.covers.popitem(last=False)
+                self.size -= evicted.size
+        return cover
+
+_cover_cache_instance = None
+_cover_cache_lock = threading.Lock()
+
+def get_cover_cache():
+    """
+    Gets the single instance of the CoverCache, configured from the
+    COVER_CACHE_MB, COVER_MAX_SIZE, COVER_QUALITY and COVER_MAX_KB
+    environment variables.
+    """
+    global _cover_cache_instance
+    if _cover_cache_instance is None:
+        with _cover_cache_lock:
+            if _cover_cache_instance is None:
+                _cover_cache_instance = CoverCache(
+                    max_bytes=int(os.getenv("COVER_CACHE_MB", "32")) * 1024 * 1024,
+                    max_size=int(os.getenv("COVER_MAX_SIZE", "1600")),
+                    quality=int(os.getenv("COVER_QUALITY", "85")),
+                    max_image_bytes=int(os.getenv("COVER_MAX_KB", "500")) * 1024,
+                )
+    return _cover_cache_instance
@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import os
+import threading
+from datetime import timedelta
+
+from telegram import InputFile
+from telegram.error import BadRequest, RetryAfter
+
+from lncrawl.core import metrics
+
+logger = logging.getLogger(__name__)
+
+SENT = metrics.REGISTRY.counter("lncrawl_telegram_requests_total", "Requests made to Telegram by kind")
+FLOOD_WAITS = metrics.REGISTRY.counter("lncrawl_telegram_flood_waits_total", "Requests Telegram asked to retry later")
+
+class TelegramDispatcher:
+    """
+    Sends everything worker threads have for Telegram from one long-lived
+    event loop. Each chat's requests go out in the order they were made,
+    paced to stay under Telegram's flood limits: `global_rate` requests a
+    second overall, one every `chat_interval` seconds per chat, and one
+    every `group_interval` seconds per group. When Telegram still asks to
+    retry later, the chat waits that long and the request is retried.
+
+    Progress messages are coalesced: a job's status is one message that is
+    edited, and only the latest text is sent if it changes faster than the
+    chat may be written to.
+    """
+    def __init__(self, bot, loop=None, global_rate=25, chat_interval=1.0,
+                 group_interval=3.0, retries=3, upload_timeout=300):
+        self.bot = bot
+        if loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="telegram_dispatcher", daemon=True).start()
+        self.loop = loop
+        self.global_rate = global_rate
+        self.chat_interval = chat_interval
+        self.group_interval = group_interval
+        self.retries = retries
+        self.upload_timeout = upload_timeout
+        # Everything below is only touched on the loop
+        self.next_slot = 0.0
+        self.next_chat_slot = {}
+        self.tails = {}
+        self.statuses = {}
+
+    def send_message(self, chat_id, text):
+        """Queues a message and returns a Future of it without waiting."""
+        return self._submit(chat_id, "message", lambda: self.bot.send_message(chat_id, text=text))
+
+    def send_document(self, chat_id, file_id):
+        """Queues a document already on Telegram and returns a Future of it."""
+        return self._submit(chat_id, "document", lambda: self.bot.send_document(chat_id, document=file_id))
+
+    def upload(self, chat_id, path, thumbnail=None):
+        """
+        Uploads the file at `path` and waits for the sent message. The file
+        is streamed from disk rather than read into memory.
+        """
+        return self._submit(chat_id, "upload", lambda: self._upload(chat_id, path, thumbnail)).result()
+
+    def set_status(self, chat_id, key, text):
+        """Shows `text` as the progress of the job `key` in the chat, editing its last status."""
+        self.loop.call_soon_threadsafe(self._set_status, chat_id, key, text)
+
+    def end_status(self, chat_id, key):
+        """Forgets the status message of the job `key`; the next one is a new message."""
+        self.loop.call_soon_threadsafe(self.statuses.pop, (chat_id, key), None)
+
+    def _submit(self, chat_id, kind, make_call):
+        return asyncio.run_coroutine_threadsafe(self._send(chat_id, kind, make_call), self.loop)
+
+    async def _upload(self, chat_id, path, thumbnail):
+        with open(path, 'rb') as document:
+            return await self.bot.send_document(
+                chat_id,
+                document=InputFile(document, filename=os.path.basename(path), read_file_handle=False),
+                thumbnail=thumbnail,
+                write_timeout=self.upload_timeout,
+            )
+
+    def _set_status(self, chat_id, key, text):
+        status = self.statuses.get((chat_id, key))
+        if status is None:
+            status = self.statuses[(chat_id, key)] = {"message_id": None, "text": None, "shown": None, "queued": False}
+        status["text"] = text
+        if not status["queued"]:
+            status["queued"] = True
+            task = self.loop.create_task(self._send(chat_id, "status", lambda: self._show_status(chat_id, status)))
+            task.add_done_callback(self._log_status_failure)
+
+    def _log_status_failure(self, task):
+        if not task.cancelled() and task.exception():
+            logger.error(f"Failed to update a status message: {task.exception()}")
+
+    async def _show_status(self, chat_id, status):
+        # Updates made from here on get a request of their own
+        status["queued"] = False
+        text = status["text"]
+        if text == status["shown"]:
+            return None
+        if status["message_id"] is not None:
+            try:
+                message = await self.bot.edit_message_text(text, chat_id=chat_id, message_id=status["message_id"])
+                status["shown"] = text
+                return message
+            except BadRequest as e:
+                if "not modified" in str(e).lower():
+                    return None
+                # The message is gone; post a new one
+        message = await self.bot.send_message(chat_id, text=text)
+        status["message_id"] = message.message_id
+        status["shown"] = text
+        return message
+
+    async def _send(self, chat_id, kind, make_call):
+        # Requests to a chat run one after the other, in the order made
+        previous = self.tails.get(chat_id)
+        done = self.loop.create_future()
+        self.tails[chat_id] = done
+        try:
+            if previous is not None:
+                await previous
+            return await self._call(chat_id, kind, make_call)
+        finally:
+            done.set_result(None)
+            if self.tails.get(chat_id) is done:
+                del self.tails[chat_id]
+
+    async def _call(self, chat_id, kind, make_call):
+        for attempt in range(self.retries + 1):
+            await self._wait_turn(chat_id)
+            try:
+                result = await make_call()
+                SENT.inc(kind=kind)
+                return result
+            except RetryAfter as e:
+                if attempt == self.retries:
+                    raise
+                delay = e.retry_after
+                if isinstance(delay, timedelta):
+                    delay = delay.total_seconds()
+                FLOOD_WAITS.inc()
+                logger.warning(f"Telegram asked to wait {delay}s before writing to {chat_id}")
+                self.next_chat_slot[chat_id] = self.loop.time() + delay
+
+    async def _wait_turn(self, chat_id):
+        """Waits until both the chat and the bot may be written to again."""
+        # Requests to one chat already run one at a time, so only the
+        # global slot has to be reserved before sleeping
+        delay = self.next_chat_slot.get(chat_id, 0.0) - self.loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        now = self.loop.time()
+        start = max(now, self.next_slot)
+        self.next_slot = start + 1 / self.global_rate
+        if start > now:
+            await asyncio.sleep(start - now)
+        # Group and channel ids are negative
+        interval = self.group_interval if str(chat_id).startswith("-") else self.chat_interval
+        self.next_chat_slot[chat_id] = start + interval
+        if len(self.next_chat_slot) > 10000:
+            self.next_chat_slot = {c: t for c, t in self.next_chat_slot.items() if t > now}
@@ -0,0 +1,70 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import brotli  # noqa: F401  (lets urllib3 decode "br" responses)
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    ACCEPT_ENCODING = "gzip, deflate"
+
+# (connect, read) timeouts in seconds, used when a caller doesn't pass one
+DEFAULT_TIMEOUT = (10, 30)
+# Connections kept alive per host
+POOL_MAXSIZE = 32
+# Number of host pools kept around
+POOL_CONNECTIONS = 64
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that applies DEFAULT_TIMEOUT to every request without an
+    explicit timeout, so no request can hang a worker thread forever.
+    """
+    def __init__(self, *args, timeout=DEFAULT_TIMEOUT, **kwargs):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+def create_session():
+    """Creates a session with pooled keep-alive connections."""
+    # Failed responses and read errors are retried by the caller through
+    # the per-host throttle, so that its rate limit, concurrency limit and
+    # circuit breaker see every attempt. Only a connection that couldn't be
+    # opened, which never reached the host, is retried here.
+    retry = Retry(
+        total=1,
+        connect=1,
+        read=0,
+        status=0,
+        other=0,
+        backoff_factor=0.5,
+        allowed_methods=("GET", "HEAD"),
+        raise_on_status=False,
+    )
+    adapter = TimeoutHTTPAdapter(
+        max_retries=retry,
+        pool_connections=POOL_CONNECTIONS,
+        pool_maxsize=POOL_MAXSIZE,
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+    return session
+
+_session_instance = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """Gets the process-wide HTTP session shared by all parsers and binders."""
+    global _session_instance
+    if _session_instance is None:
+        with _session_lock:
+            if _session_instance is None:
+                _session_instance = create_session()
+    return _session_instance
@@ -0,0 +1,196 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import pymongo
+from bson import ObjectId
+
+logger = logging.getLogger(__name__)
+
+class JobQueue:
+    """
+    Durable crawl job queue stored in MongoDB through `Database`, so queued
+    and running jobs survive restarts of the web and worker processes.
+
+    Jobs are claimed by priority first. Within a priority each chat takes
+    turns: a chat's n-th outstanding job waits behind every other chat's
+    first n jobs, so one user pasting 20 URLs can't take over all workers.
+    A claimed job holds a lease that its worker keeps renewing; if the
+    worker dies the lease runs out and another worker picks the job up.
+    """
+    def __init__(self, database, lease_seconds=300, max_attempts=3):
+        self.jobs = database.sync_db.jobs
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+    def ensure_indexes(self):
+        self.jobs.create_index([("status", 1), ("priority", -1), ("turn", 1), ("created_at", 1)])
+        self.jobs.create_index([("chat_id", 1), ("status", 1)])
+        # Finished jobs are only kept for a day for the wait-time stats
+        self.jobs.create_index("finished_at", expireAfterSeconds=24 * 3600)
+
+    def enqueue(self, chat_id, url, options=None, priority=0):
+        """Adds a job and returns its id."""
+        turn = self.jobs.count_documents({"chat_id": chat_id, "status": {"$in": ["queued", "running"]}})
+        result = self.jobs.insert_one({
+            "chat_id": chat_id,
+            "url": url,
+            "options": options or {},
+            "priority": priority,
+            "turn": turn,
+            "status": "queued",
+            "attempts": 0,
+            "created_at": datetime.now(timezone.utc),
+        })
+        return result.inserted_id
+
+    def claim(self, worker_id):
+        """Takes the next job for `worker_id`, or returns None if there is none."""
+        now = datetime.now(timezone.utc)
+        return self.jobs.find_one_and_update(
+            {
+                "$or": [
+                    {"status": "queued"},
+                    # Jobs of a worker that stopped renewing its lease
+                    {"status": "running", "lease_until": {"$lt": now}},
+                ],
+                "attempts": {"$lt": self.max_attempts},
+            },
+            {
+                "$set": {
+                    "status": "running",
+                    "worker": worker_id,
+                    "started_at": now,
+                    "lease_until": now + timedelta(seconds=self.lease_seconds),
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("priority", pymongo.DESCENDING), ("turn", pymongo.ASCENDING), ("created_at", pymongo.ASCENDING)],
+            return_document=pymongo.ReturnDocument.AFTER,
+        )
+
+    def fail_abandoned(self):
+        """
+        Marks as failed the jobs whose worker stopped renewing the lease on
+        their last attempt, and returns them so their chats can be told.
+        """
+        failed = []
+        while True:
+            now = datetime.now(timezone.utc)
+            # One at a time, so each job is only reported by one worker
+            job = self.jobs.find_one_and_update(
+                {"status": "running", "lease_until": {"$lt": now}, "attempts": {"$gte": self.max_attempts}},
+                {"$set": {
+                    "status": "failed",
+                    "error": "the worker stopped on every attempt",
+                    "finished_at": now,
+                }},
+                return_document=pymongo.ReturnDocument.AFTER,
+            )
+            if not job:
+                return failed
+            failed.append(job)
+
+    def renew(self, job_id, worker_id):
+        """Extends the lease of a running job. Returns False if it was lost."""
+        result = self.jobs.update_one(
+            {"_id": ObjectId(job_id), "worker": worker_id, "status": "running"},
+            {"$set": {"lease_until": datetime.now(timezone.utc) + timedelta(seconds=self.lease_seconds)}},
+        )
+        return result.modified_count == 1
+
+    def complete(self, job_id, error=None):
+        self.jobs.update_one(
+            {"_id": ObjectId(job_id)},
+            {"$set": {
+                "status": "failed" if error else "done",
+                "error": error,
+                "finished_at": datetime.now(timezone.utc),
+            }},
+        )
+
+    def position(self, job_id):
+        """Returns how many jobs will be claimed before `job_id`."""
+        job = self.jobs.find_one({"_id": ObjectId(job_id)})
+        if not job or job["status"] != "queued":
+            return 0
+        return self.jobs.count_documents({
+            "status": "queued",
+            "$or": [
+                {"priority": {"$gt": job["priority"]}},
+                {"priority": job["priority"], "turn": {"$lt": job["turn"]}},
+                {"priority": job["priority"], "turn": job["turn"], "created_at": {"$lt": job["created_at"]}},
+            ],
+        })
+
+    def stats(self):
+        """
+        Returns the queue depth, the number of running jobs, the age of the
+        oldest queued job and the average wait of jobs started in the last
+        hour, in seconds.
+        """
+        now = datetime.now(timezone.utc)
+        oldest = self.jobs.find_one({"status": "queued"}, sort=[("created_at", pymongo.ASCENDING)])
+        recent = list(self.jobs.aggregate([
+            {"$match": {"started_at": {"$gte": now - timedelta(hours=1)}}},
+            {"$group": {"_id": None, "wait": {"$avg": {"$subtract": ["$started_at", "$created_at"]}}}},
+        ]))
+        return {
+            "queued": self.jobs.count_documents({"status": "queued"}),
+            "running": self.jobs.count_documents({"status": "running"}),
+            "oldest_wait": (now - _aware(oldest["created_at"])).total_seconds() if oldest else 0,
+            "average_wait": recent[0]["wait"] / 1000 if recent else 0,
+        }
+
+def _aware(value):
+    # pymongo returns naive UTC datetimes unless the client is tz_aware
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+def run_worker(queue, handle_job, worker_id, poll_interval=2.0, stop_event=None, on_failed=None):
+    """
+    Claims and runs jobs until `stop_event` is set. `handle_job(job)` does
+    the work; the job's lease is renewed in the background meanwhile.
+    `on_failed(job)` is called for jobs given up on after their attempts
+    ran out.
+    """
+    stop_event = stop_event or threading.Event()
+    while not stop_event.is_set():
+        try:
+            for failed_job in queue.fail_abandoned():
+                logger.error(f"Job {failed_job['_id']} for {failed_job['url']} failed on every attempt")
+                if on_failed:
+                    on_failed(failed_job)
+        except Exception as e:
+            logger.error(f"Failed to expire abandoned jobs: {e}")
+        try:
+            job = queue.claim(worker_id)
+        except Exception as e:
+            logger.error(f"Failed to claim a job: {e}")
+            job = None
+        if not job:
+            stop_event.wait(poll_interval)
+            continue
+
+        logger.info(f"{worker_id} picked up {job['url']} for chat {job['chat_id']}")
+        done = threading.Event()
+
+        def heartbeat():
+            while not done.wait(queue.lease_seconds / 3):
+                try:
+                    queue.renew(job["_id"], worker_id)
+                except Exception as e:
+                    logger.warning(f"Failed to renew the lease of job {job['_id']}: {e}")
+
+        threading.Thread(target=heartbeat, daemon=True).start()
+        error = None
+        started = time.time()
+        try:
+            handle_job(job)
+        except Exception as e:
+            logger.error(f"Job {job['_id']} failed: {e}", exc_info=True)
+            error = str(e)
+        finally:
+            done.set()
+        queue.complete(job["_id"], error=error)
+        logger.info(f"{worker_id} finished {job['url']} in {time.time() - started:.1f}s")
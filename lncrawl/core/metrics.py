@@ -0,0 +1,156 @@
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(key):
+    if not key:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in key) + "}"
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, key, value) for key, value in self.values.items()]
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def __init__(self, name, help, function=None):
+        super().__init__(name, help)
+        self.function = function
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[_label_key(labels)] = value
+
+    def samples(self):
+        if self.function:
+            try:
+                self.set(self.function())
+            except Exception:
+                pass
+        return super().samples()
+
+class Histogram(Counter):
+    type = "histogram"
+    DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            counts, total, count = self.values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            counts = [c + (value <= bound) for c, bound in zip(counts, self.buckets)]
+            self.values[key] = (counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            for key, (counts, total, count) in self.values.items():
+                for bound, bucket_count in zip(self.buckets, counts):
+                    samples.append((f"{self.name}_bucket", key + (("le", bound),), bucket_count))
+                samples.append((f"{self.name}_bucket", key + (("le", "+Inf"),), count))
+                samples.append((f"{self.name}_sum", key, total))
+                samples.append((f"{self.name}_count", key, count))
+        return samples
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _get(self, cls, name, help, **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = cls(name, help, **kwargs)
+                self.metrics[name] = metric
+            return metric
+
+    def counter(self, name, help):
+        return self._get(Counter, name, help)
+
+    def gauge(self, name, help, function=None):
+        gauge = self._get(Gauge, name, help)
+        if function:
+            gauge.function = function
+        return gauge
+
+    def histogram(self, name, help, **kwargs):
+        return self._get(Histogram, name, help, **kwargs)
+
+    def render(self):
+        """Renders every metric in the Prometheus text exposition format."""
+        lines = []
+        with self.lock:
+            metrics = list(self.metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, key, value in metric.samples():
+                lines.append(f"{name}{_format_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+# Stage metrics shared by the parsers, binders and the bot
+TOC_FETCH_SECONDS = REGISTRY.histogram("lncrawl_toc_fetch_seconds", "Time to read a novel's info and chapter list")
+CHAPTER_FETCH_SECONDS = REGISTRY.histogram("lncrawl_chapter_fetch_seconds", "Latency of chapter page requests")
+PARSE_SECONDS = REGISTRY.histogram("lncrawl_parse_seconds", "Time to parse a chapter page and extract its content")
+DOWNLOADED_BYTES = REGISTRY.counter("lncrawl_downloaded_bytes_total", "Bytes downloaded from sources")
+CHAPTERS = REGISTRY.counter("lncrawl_chapters_total", "Chapters by how their body was obtained")
+BUILD_SECONDS = REGISTRY.histogram("lncrawl_build_seconds", "Time spent writing an EPUB volume")
+UPLOAD_SECONDS = REGISTRY.histogram("lncrawl_upload_seconds", "Time to upload a volume to Telegram")
+JOB_SECONDS = REGISTRY.histogram("lncrawl_job_seconds", "Duration of whole novel jobs")
+JOBS = REGISTRY.counter("lncrawl_jobs_total", "Novel jobs by outcome")
+
+def start_http_server(port, registry=REGISTRY):
+    """Serves /metrics on `port` from a daemon thread, for processes without Flask."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = registry.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
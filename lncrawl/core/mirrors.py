@@ -0,0 +1,196 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlparse
+
+from lncrawl.core import metrics
+
+logger = logging.getLogger(__name__)
+
+HEDGES = metrics.REGISTRY.counter("lncrawl_hedged_requests_total", "Requests also sent to a second mirror")
+FAILOVERS = metrics.REGISTRY.counter("lncrawl_mirror_failovers_total", "Requests retried on another mirror")
+
+# Runs the requests of every mirror group; callers only wait on them
+_executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix="mirror")
+
+def _host(url):
+    hostname = (urlparse(url).hostname or "").lower()
+    return hostname[4:] if hostname.startswith("www.") else hostname
+
+def _succeeded(response):
+    return response.status_code < 400
+
+class MirrorGroup:
+    """
+    Domains that serve the same site. Each request goes to the fastest
+    healthy mirror, judged by a moving average of its latency.
+
+    If the answer takes longer than the `hedge_percentile` latency of that
+    mirror, the same request is also sent to the next best one and the
+    first good answer wins; at most `max_hedge_ratio` of requests are
+    hedged. A mirror that errors is failed over to the next one, and after
+    `failure_threshold` errors in a row it is only used as a last resort
+    for `cooldown` seconds. While other mirrors remain, a request doesn't
+    wait more than `max_pause` seconds for a throttled host.
+    """
+    def __init__(self, base_urls, hedge_percentile=0.95, max_hedge_ratio=0.1,
+                 failure_threshold=3, cooldown=60, min_samples=20, max_pause=5):
+        self.mirrors = [f"{urlparse(url).scheme}://{urlparse(url).netloc}" for url in base_urls]
+        self.hedge_percentile = hedge_percentile
+        self.max_hedge_ratio = max_hedge_ratio
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.min_samples = min_samples
+        self.max_pause = max_pause
+        self.stats = {
+            mirror: {"latency": None, "samples": deque(maxlen=100), "failures": 0, "unhealthy_until": 0.0}
+            for mirror in self.mirrors
+        }
+        self.requests = 0
+        self.hedges = 0
+        self.lock = threading.Lock()
+
+    def rewrite(self, url, mirror):
+        parsed = urlparse(url)
+        return mirror + url[len(f"{parsed.scheme}://{parsed.netloc}"):]
+
+    def ranked(self):
+        """
+        Healthy mirrors, those without recent errors and then the fastest
+        first (untried ones before them), then the ones resting.
+        """
+        now = time.time()
+        with self.lock:
+            healthy = [m for m in self.mirrors if self.stats[m]["unhealthy_until"] <= now]
+            resting = [m for m in self.mirrors if self.stats[m]["unhealthy_until"] > now]
+            healthy.sort(key=lambda m: (self.stats[m]["failures"], self.stats[m]["latency"] or 0.0))
+            resting.sort(key=lambda m: self.stats[m]["unhealthy_until"])
+        return healthy + resting
+
+    def record(self, mirror, seconds, ok):
+        with self.lock:
+            stats = self.stats[mirror]
+            if ok:
+                stats["failures"] = 0
+                stats["samples"].append(seconds)
+                previous = stats["latency"]
+                stats["latency"] = seconds if previous is None else 0.8 * previous + 0.2 * seconds
+                return
+            stats["failures"] += 1
+            if stats["failures"] >= self.failure_threshold and stats["unhealthy_until"] <= time.time():
+                stats["unhealthy_until"] = time.time() + self.cooldown
+                logger.warning(f"Avoiding mirror {mirror} for {self.cooldown}s after {stats['failures']} errors")
+
+    def hedge_delay(self, mirror):
+        """How long to wait for `mirror` before hedging, or None if unknown yet."""
+        with self.lock:
+            samples = sorted(self.stats[mirror]["samples"])
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(self.hedge_percentile * len(samples)))]
+
+    def fetch(self, url, fetch_one):
+        """
+        Gets `url` from the best mirror with `fetch_one(url, max_pause)`,
+        hedging and failing over as needed. Returns the first successful response, or
+        else the last response or error.
+        """
+        with self.lock:
+            self.requests += 1
+        candidates = deque(self.ranked())
+        pending = {}
+        last_response = last_error = None
+        hedged = False
+
+        def launch():
+            mirror = candidates.popleft()
+            # The last mirror left waits for its host as long as it has to
+            max_pause = self.max_pause if candidates else None
+            future = _executor.submit(self._fetch_timed, mirror, fetch_one, self.rewrite(url, mirror), max_pause)
+            pending[future] = mirror
+
+        launch()
+        started = time.monotonic()
+        while pending:
+            hedge_at = None
+            if not hedged and candidates and self._may_hedge():
+                delay = self.hedge_delay(next(iter(pending.values())))
+                if delay is not None:
+                    hedge_at = started + delay
+            timeout = None
+            if candidates:
+                # Wake up now and then in case the mirror starts failing meanwhile
+                timeout = 1.0 if hedge_at is None else max(0.0, min(1.0, hedge_at - time.monotonic()))
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                if all(self._resting(mirror) for mirror in pending.values()):
+                    # Don't wait in line for a mirror that has gone bad
+                    FAILOVERS.inc()
+                    launch()
+                elif hedge_at is not None and time.monotonic() >= hedge_at and not self._resting(candidates[0]):
+                    hedged = True
+                    with self.lock:
+                        self.hedges += 1
+                    HEDGES.inc()
+                    launch()
+                continue
+            for future in done:
+                pending.pop(future)
+                try:
+                    response = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                if _succeeded(response):
+                    # The other copy isn't needed if it hasn't started yet
+                    for other in pending:
+                        other.cancel()
+                    return response
+                last_response = response
+            if not pending and candidates:
+                FAILOVERS.inc()
+                launch()
+        if last_response is not None:
+            return last_response
+        raise last_error
+
+    def _resting(self, mirror):
+        with self.lock:
+            return self.stats[mirror]["unhealthy_until"] > time.time()
+
+    def _may_hedge(self):
+        with self.lock:
+            return self.hedges < self.max_hedge_ratio * self.requests
+
+    def _fetch_timed(self, mirror, fetch_one, url, max_pause):
+        start = time.perf_counter()
+        try:
+            response = fetch_one(url, max_pause)
+        except Exception:
+            self.record(mirror, time.perf_counter() - start, False)
+            raise
+        # 304 is a success; a 404 may just mean this mirror is behind
+        self.record(mirror, time.perf_counter() - start, _succeeded(response))
+        return response
+
+_groups = {}
+_groups_lock = threading.Lock()
+
+def get_mirror_group(url, mirror_groups, **config):
+    """
+    Gets the process-wide MirrorGroup among `mirror_groups` (lists of base
+    URLs) that serves `url`, or None if it isn't mirrored.
+    """
+    host = _host(url)
+    for base_urls in mirror_groups:
+        key = tuple(sorted(_host(base) for base in base_urls))
+        if host not in key:
+            continue
+        group = _groups.get(key)
+        if group is None:
+            with _groups_lock:
+                group = _groups.setdefault(key, MirrorGroup(base_urls, **config))
+        return group
+    return None
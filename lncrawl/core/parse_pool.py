@@ -0,0 +1,63 @@
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+def extract_chapter_body(parser_class, novel_url, content):
+    """
+    Runs in a pool process: parses a downloaded chapter page and returns
+    its cleaned-up body. Only the class (by reference), the URL and the raw
+    bytes cross the process boundary, and only the body string comes back.
+    """
+    return parser_class(novel_url).extract_chapter_body(content)
+
+def can_offload(parser_class):
+    """Pool processes can only use parser classes they can import by name."""
+    module = sys.modules.get(parser_class.__module__)
+    return (
+        module is not None
+        and parser_class.__module__ != '__main__'
+        and getattr(module, parser_class.__qualname__, None) is parser_class
+    )
+
+_parse_pool_instance = None
+_parse_pool_lock = threading.Lock()
+
+def get_parse_pool():
+    """
+    Gets the process pool that chapter pages are parsed in, sized by the
+    PARSE_PROCESSES environment variable ("auto" for one per core). Returns
+    None when it's unset or 0, and pages are then parsed in the calling
+    thread.
+    """
+    global _parse_pool_instance
+    if _parse_pool_instance is None:
+        setting = os.getenv("PARSE_PROCESSES", "0").strip().lower()
+        processes = (os.cpu_count() or 1) if setting == "auto" else int(setting or 0)
+        if processes <= 0:
+            return None
+        with _parse_pool_lock:
+            if _parse_pool_instance is None:
+                # Forking a process full of threads can deadlock the children
+                _parse_pool_instance = ProcessPoolExecutor(
+                    max_workers=processes,
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+                logger.info(f"Parsing chapters in {processes} processes")
+    return _parse_pool_instance
+
+def shutdown_parse_pool():
+    """
+    Stops the parse pool's processes. Only needed where interpreter exit
+    hooks don't run first, e.g. in a multiprocessing child, which joins
+    its own children before the pool would be shut down.
+    """
+    global _parse_pool_instance
+    with _parse_pool_lock:
+        pool, _parse_pool_instance = _parse_pool_instance, None
+    if pool:
+        pool.shutdown()
@@ -0,0 +1,48 @@
+import re
+
+class ChapterRange:
+    """
+    A selection of chapters by their number in the table of contents:
+    "300-400", "300-" (300 to the end) or "last 50".
+    """
+    def __init__(self, start=None, end=None, last=None):
+        self.start = start
+        self.end = end
+        self.last = last
+
+    @classmethod
+    def parse(cls, text):
+        """Returns the ChapterRange written in `text`, or None if there isn't one."""
+        text = text.strip().lower()
+        match = re.fullmatch(r'last\s*(\d+)', text)
+        if match:
+            last = int(match.group(1))
+            return cls(last=last) if last else None
+        match = re.fullmatch(r'(\d+)\s*[-–]\s*(\d+)?', text)
+        if match:
+            start = int(match.group(1))
+            end = int(match.group(2)) if match.group(2) else None
+            if end is not None and end < start:
+                start, end = end, start
+            if end == 0:
+                return None
+            return cls(start=max(1, start), end=end)
+        return None
+
+    def select(self, chapters):
+        """Returns the chapters in the range, given the whole list in order."""
+        if self.last:
+            return chapters[-self.last:]
+        return chapters[self.start - 1:self.end]
+
+    def covered(self, count):
+        """
+        Whether the first `count` chapters include the whole range, so the
+        rest of the table of contents isn't needed. "last N" never is.
+        """
+        return self.end is not None and count >= self.end
+
+    def __str__(self):
+        if self.last:
+            return f"last {self.last}"
+        return f"{self.start}-{self.end or ''}"
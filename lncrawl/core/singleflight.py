@@ -0,0 +1,136 @@
+import logging
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+class Flight:
+    """
+    One in-flight crawl and the chats waiting for its result. Only the
+    leader holds a Flight; the other requesters are just subscribers.
+    """
+    def __init__(self, coordinator, key, chat_id):
+        self.coordinator = coordinator
+        self.key = key
+        self.token = uuid.uuid4().hex
+        self._subscribers = [chat_id]
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        if coordinator.leases is not None:
+            threading.Thread(target=self._heartbeat, daemon=True).start()
+
+    def add(self, chat_id):
+        with self._lock:
+            if chat_id not in self._subscribers:
+                self._subscribers.append(chat_id)
+
+    def subscribers(self):
+        """Returns every chat subscribed so far, including other processes' ones."""
+        if self.coordinator.leases is not None:
+            try:
+                lease = self.coordinator.leases.find_one({"_id": self.key, "owner": self.token})
+                for chat_id in (lease or {}).get("subscribers", []):
+                    self.add(chat_id)
+            except Exception as e:
+                logger.warning(f"Failed to read subscribers of {self.key}: {e}")
+        with self._lock:
+            return list(self._subscribers)
+
+    def finish(self):
+        """Ends the flight and returns the final list of subscribers."""
+        self._done.set()
+        self.coordinator._remove(self)
+        if self.coordinator.leases is not None:
+            try:
+                # Atomically, so nobody can subscribe after the last read
+                lease = self.coordinator.leases.find_one_and_delete({"_id": self.key, "owner": self.token})
+                for chat_id in (lease or {}).get("subscribers", []):
+                    self.add(chat_id)
+            except Exception as e:
+                logger.warning(f"Failed to release the lease of {self.key}: {e}")
+        with self._lock:
+            return list(self._subscribers)
+
+    def _heartbeat(self):
+        lease_seconds = self.coordinator.lease_seconds
+        while not self._done.wait(lease_seconds / 3):
+            try:
+                self.coordinator.leases.update_one(
+                    {"_id": self.key, "owner": self.token},
+                    {"$set": {"lease_until": datetime.now(timezone.utc) + timedelta(seconds=lease_seconds)}},
+                )
+            except Exception as e:
+                logger.warning(f"Failed to renew the lease of {self.key}: {e}")
+
+class CrawlCoordinator:
+    """
+    Coalesces identical crawls. The first requester of a key becomes the
+    leader and gets a Flight; later requesters are subscribed to it and
+    get nothing back, because the leader delivers to all subscribers.
+
+    Within a process this uses an in-memory map. With a `database`, a lease
+    document per key in MongoDB extends it across worker processes. If a
+    leader dies, its lease runs out and the next requester takes over the
+    key together with its subscribers.
+    """
+    def __init__(self, database=None, lease_seconds=120):
+        self.leases = database.sync_db.crawl_leases if database else None
+        self.lease_seconds = lease_seconds
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def ensure_indexes(self):
+        if self.leases is not None:
+            # Clean up the leases of dead leaders
+            self.leases.create_index("lease_until", expireAfterSeconds=self.lease_seconds)
+
+    def join(self, key, chat_id):
+        """Returns a Flight if `chat_id` leads the crawl of `key`, else None."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight:
+                flight.add(chat_id)
+                return None
+            flight = Flight(self, key, chat_id)
+            if self.leases is not None and not self._acquire(flight, chat_id):
+                flight._done.set()
+                return None
+            self._flights[key] = flight
+            return flight
+
+    def _acquire(self, flight, chat_id):
+        while True:
+            now = datetime.now(timezone.utc)
+            lease_until = now + timedelta(seconds=self.lease_seconds)
+            try:
+                self.leases.insert_one({
+                    "_id": flight.key,
+                    "owner": flight.token,
+                    "lease_until": lease_until,
+                    "subscribers": [chat_id],
+                })
+                return True
+            except DuplicateKeyError:
+                pass
+            # Take over from a leader that stopped renewing its lease
+            taken = self.leases.find_one_and_update(
+                {"_id": flight.key, "lease_until": {"$lt": now}},
+                {"$set": {"owner": flight.token, "lease_until": lease_until}, "$addToSet": {"subscribers": chat_id}},
+            )
+            if taken:
+                return True
+            joined = self.leases.update_one(
+                {"_id": flight.key, "lease_until": {"$gte": now}},
+                {"$addToSet": {"subscribers": chat_id}},
+            )
+            if joined.matched_count:
+                return False
+            # The lease was released in the meantime, try again
+
+    def _remove(self, flight):
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
@@ -1,62 +1,196 @@
+import ast
 import importlib
+import json
 import logging
 import os
+import threading
 from urllib.parse import urlparse
 
 logger = logging.getLogger(__name__)
 
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def normalize_hostname(hostname):
+    hostname = hostname.lower().split(':')[0].rstrip('.')
+    if hostname.startswith('www.'):
+        hostname = hostname[4:]
+    elif hostname.startswith('m.'):
+        hostname = hostname[2:]
+    return hostname
+
 class SourceManager:
     """
-    Loads and manages all available parser classes from the 'sources' directory.
+    Finds parser classes for URLs without importing every source module.
+
+    On start-up only a hostname -> module manifest is read. It is cached in
+    `index_path` and rebuilt by parsing (not importing) the source files
+    whenever one of them changes. A parser module is imported the first
+    time one of its hosts is requested.
+
+    Hostnames come from a parser's `base_url` list plus its optional
+    `aliases` list of extra mirror hostnames. Lookups are suffix-aware, so
+    `es.fannovels.com` or `m.fannovel.net` find the parser of the parent
+    domain.
     """
-    def __init__(self):
+    def __init__(self, sources_dir=None, index_path=None):
+        self.sources_dir = sources_dir or os.path.join(PROJECT_ROOT, 'sources')
+        self.index_path = index_path if index_path is not None else os.getenv(
+            "SOURCE_INDEX_PATH", os.path.join("cache", "source_index.json"))
         self.parsers = {}
+        self.index = {}
+        self._lock = threading.Lock()
         self.load_parsers()
 
     def load_parsers(self):
         """
-        Dynamically imports all parser modules from the `sources` directory.
+        Loads the hostname manifest, rebuilding it if any source changed.
         """
-        project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-        sources_dir = os.path.join(project_root, 'sources')
-
-        if not os.path.isdir(sources_dir):
-            logger.warning(f"Sources directory not found at: {sources_dir}")
+        if not os.path.isdir(self.sources_dir):
+            logger.warning(f"Sources directory not found at: {self.sources_dir}")
             return
 
-        for root, _, files in os.walk(sources_dir):
-            for file in files:
+        fingerprint = self._fingerprint()
+        manifest = self._read_manifest()
+        if not manifest or manifest.get('fingerprint') != fingerprint:
+            manifest = {'fingerprint': fingerprint, 'hosts': self._scan()}
+            self._write_manifest(manifest)
+        self.index = manifest['hosts']
+        logger.info(f"-> Indexed {len(self.index)} hostnames")
+
+    def _module_files(self):
+        for root, dirs, files in os.walk(self.sources_dir):
+            dirs.sort()
+            for file in sorted(files):
                 if file.endswith('.py') and not file.startswith('__'):
-                    module_path = os.path.join(root, file)
-                    relative_path = os.path.relpath(module_path, project_root)
-                    module_name = relative_path.replace(os.sep, '.')[:-3]
-                    
+                    yield os.path.join(root, file)
+
+    def _module_name(self, module_path):
+        package_root = os.path.dirname(self.sources_dir)
+        relative_path = os.path.relpath(module_path, package_root)
+        return relative_path.replace(os.sep, '.')[:-3]
+
+    def _fingerprint(self):
+        return {
+            os.path.relpath(path, self.sources_dir): os.stat(path).st_mtime_ns
+            for path in self._module_files()
+        }
+
+    def _read_manifest(self):
+        if not self.index_path:
+            return None
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest.get('sources_dir') != self.sources_dir:
+            return None
+        return manifest
+
+    def _write_manifest(self, manifest):
+        if not self.index_path:
+            return
+        try:
+            directory = os.path.dirname(self.index_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp_path = f"{self.index_path}.{os.getpid()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(dict(manifest, sources_dir=self.sources_dir), f)
+            os.replace(temp_path, self.index_path)
+        except OSError as e:
+            logger.warning(f"Could not write the source index to {self.index_path}: {e}")
+
+    def _scan(self):
+        """Maps every hostname to [module name, class name]."""
+        hosts = {}
+        for module_path in self._module_files():
+            module_name = self._module_name(module_path)
+            try:
+                parsers = self._scan_module(module_path)
+            except Exception as e:
+                logger.error(f"Failed to index parsers in {module_name}: {e}")
+                continue
+            for class_name, urls in parsers:
+                for url in urls:
+                    hostname = normalize_hostname(urlparse(url).netloc or url)
+                    hosts[hostname] = [module_name, class_name]
+        return hosts
+
+    def _scan_module(self, module_path):
+        """
+        Yields (class name, hosts) for each parser class in a module, read
+        from the source. Modules whose hosts aren't plain literals are
+        imported to find out.
+        """
+        with open(module_path, 'r', encoding='utf-8') as f:
+            tree = ast.parse(f.read(), module_path)
+        found = []
+        for node in tree.body:
+            if not isinstance(node, ast.ClassDef) or not node.name.endswith('Parser'):
+                continue
+            urls = []
+            for statement in node.body:
+                if isinstance(statement, ast.Assign) and len(statement.targets) == 1 \
+                        and isinstance(statement.targets[0], ast.Name) \
+                        and statement.targets[0].id in ('base_url', 'aliases'):
                     try:
-                        module = importlib.import_module(module_name)
-                        for attr_name in dir(module):
-                            if attr_name.endswith('Parser') and attr_name != 'WebToEpubParser':
-                                ParserClass = getattr(module, attr_name)
-                                if hasattr(ParserClass, 'base_url') and isinstance(ParserClass.base_url, list):
-                                    for url in ParserClass.base_url:
-                                        hostname = urlparse(url).netloc
-                                        self.parsers[hostname] = ParserClass
-                                        logger.info(f"-> Loaded parser for: {hostname}")
+                        urls.extend(ast.literal_eval(statement.value))
+                    except ValueError:
+                        return self._scan_imported(module_path)
+            if urls:
+                found.append((node.name, urls))
+        return found
+
+    def _scan_imported(self, module_path):
+        module = importlib.import_module(self._module_name(module_path))
+        found = []
+        for attr_name in dir(module):
+            if attr_name.endswith('Parser') and attr_name != 'WebToEpubParser':
+                ParserClass = getattr(module, attr_name)
+                if hasattr(ParserClass, 'base_url') and isinstance(ParserClass.base_url, list):
+                    found.append((attr_name, ParserClass.base_url + list(getattr(ParserClass, 'aliases', []))))
+        return found
+
+    def find_source(self, url):
+        """Returns [module name, class name] of the parser for a URL, or None."""
+        hostname = normalize_hostname(urlparse(url).netloc)
+        labels = hostname.split('.')
+        # Try the hostname itself, then each parent domain
+        for i in range(len(labels) - 1):
+            entry = self.index.get('.'.join(labels[i:]))
+            if entry:
+                return entry
+        return None
+
+    def get_parser_class(self, url):
+        entry = self.find_source(url)
+        if not entry:
+            return None
+        module_name, class_name = entry
+        key = f"{module_name}.{class_name}"
+        ParserClass = self.parsers.get(key)
+        if ParserClass is None:
+            with self._lock:
+                ParserClass = self.parsers.get(key)
+                if ParserClass is None:
+                    try:
+                        ParserClass = getattr(importlib.import_module(module_name), class_name)
                     except Exception as e:
                         logger.error(f"Failed to load parser from {module_name}: {e}")
+                        return None
+                    logger.info(f"-> Loaded parser {class_name} from {module_name}")
+                    self.parsers[key] = ParserClass
+        return ParserClass
 
-    def get_parser(self, url):
+    def get_parser(self, url, **kwargs):
         """
         Returns an instance of the appropriate parser class for a given URL.
+        Extra keyword arguments are passed on to the parser.
         """
-        hostname = urlparse(url).netloc
-        if hostname.startswith('www.'):
-            hostname = hostname[4:]
-        elif hostname.startswith('m.'):
-            hostname = hostname[2:]
-
-        ParserClass = self.parsers.get(hostname)
+        ParserClass = self.get_parser_class(url)
         if ParserClass:
-            return ParserClass(url)
+            return ParserClass(url, **kwargs)
         return None
 
 _source_manager_instance = None
@@ -67,3 +201,10 @@ def get_source_manager():
     if _source_manager_instance is None:
         _source_manager_instance = SourceManager()
     return _source_manager_instance
+
+if __name__ == '__main__':
+    # Rebuild and print the source index: python -m lncrawl.core.sources
+    logging.basicConfig(level=logging.INFO)
+    manager = get_source_manager()
+    for hostname, (module_name, class_name) in sorted(manager.index.items()):
+        print(f"{hostname:40} {module_name}.{class_name}")
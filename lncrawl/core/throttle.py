@@ -0,0 +1,317 @@
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+class HostUnavailableError(Exception):
+    """Raised when a host is paused for longer than a request may wait."""
+
+def _new_state(burst, now):
+    return {"tokens": burst, "updated_at": now, "blocked_until": 0.0, "failures": 0}
+
+def _take(state, now, rate, burst):
+    if state["blocked_until"] > now:
+        return state["blocked_until"] - now
+    state["tokens"] = min(burst, state["tokens"] + (now - state["updated_at"]) * rate)
+    state["updated_at"] = now
+    if state["tokens"] >= 1:
+        state["tokens"] -= 1
+        return 0
+    return (1 - state["tokens"]) / rate
+
+def _block(state, until):
+    state["blocked_until"] = max(state["blocked_until"], until)
+
+def _record(state, ok):
+    state["failures"] = 0 if ok else state["failures"] + 1
+    return state["failures"]
+
+class MemoryThrottleState:
+    """Per-host token buckets, blocks and failure counts for one process."""
+    def __init__(self):
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def _host(self, host, burst, now):
+        return self.hosts.setdefault(host, _new_state(burst, now))
+
+    def take(self, host, rate, burst):
+        """Takes a token and returns 0, or returns how long to wait first."""
+        now = time.time()
+        with self.lock:
+            return _take(self._host(host, burst, now), now, rate, burst)
+
+    def block(self, host, until):
+        with self.lock:
+            _block(self._host(host, 0, time.time()), until)
+
+    def record(self, host, ok):
+        """Counts a success or failure and returns the consecutive failures."""
+        with self.lock:
+            return _record(self._host(host, 0, time.time()), ok)
+
+class SqliteThrottleState(MemoryThrottleState):
+    """The same state in a SQLite file, shared by every process on the node."""
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS hosts ("
+            " host TEXT PRIMARY KEY,"
+            " tokens REAL NOT NULL,"
+            " updated_at REAL NOT NULL,"
+            " blocked_until REAL NOT NULL DEFAULT 0,"
+            " failures INTEGER NOT NULL DEFAULT 0)"
+        )
+
+    @contextmanager
+    def _transaction(self, host, burst):
+        now = time.time()
+        with self.lock:
+            # IMMEDIATE takes the write lock up front, so other processes wait
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO hosts (host, tokens, updated_at) VALUES (?, ?, ?)",
+                    (host, burst, now),
+                )
+                row = self.conn.execute(
+                    "SELECT tokens, updated_at, blocked_until, failures FROM hosts WHERE host = ?", (host,)
+                ).fetchone()
+                state = dict(zip(("tokens", "updated_at", "blocked_until", "failures"), row))
+                yield state, now
+                self.conn.execute(
+                    "UPDATE hosts SET tokens = ?, updated_at = ?, blocked_until = ?, failures = ? WHERE host = ?",
+                    (state["tokens"], state["updated_at"], state["blocked_until"], state["failures"], host),
+                )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def take(self, host, rate, burst):
+        with self._transaction(host, burst) as (state, now):
+            return _take(state, now, rate, burst)
+
+    def block(self, host, until):
+        with self._transaction(host, 0) as (state, now):
+            _block(state, until)
+
+    def record(self, host, ok):
+        with self._transaction(host, 0) as (state, now):
+            return _record(state, ok)
+
+class MongoThrottleState:
+    """
+    The same state in MongoDB, shared by every process and container using
+    the database. Each change reads the host's document and writes it back
+    only if nobody else has changed it meanwhile, retrying otherwise. If
+    the database can't be reached, this process falls back to its own
+    in-memory state until it can.
+    """
+    def __init__(self, database, max_conflicts=10):
+        self.hosts = database.sync_db.throttle_hosts
+        self.max_conflicts = max_conflicts
+        self.fallback = MemoryThrottleState()
+
+    def ensure_indexes(self):
+        # Hosts nobody has requested for a week are forgotten
+        self.hosts.create_index("touched_at", expireAfterSeconds=7 * 24 * 3600)
+
+    def take(self, host, rate, burst):
+        try:
+            return self._change(host, burst, lambda state, now: _take(state, now, rate, burst))
+        except Exception as e:
+            logger.warning(f"Throttling {host} locally, the shared state is unavailable: {e}")
+            return self.fallback.take(host, rate, burst)
+
+    def block(self, host, until):
+        try:
+            self._change(host, 0, lambda state, now: _block(state, until))
+        except Exception as e:
+            logger.warning(f"Throttling {host} locally, the shared state is unavailable: {e}")
+            self.fallback.block(host, until)
+
+    def record(self, host, ok):
+        try:
+            return self._change(host, 0, lambda state, now: _record(state, ok))
+        except Exception as e:
+            logger.warning(f"Throttling {host} locally, the shared state is unavailable: {e}")
+            return self.fallback.record(host, ok)
+
+    def _change(self, host, burst, change):
+        """Applies `change(state, now)` to the host's state and returns its result."""
+        for _ in range(self.max_conflicts):
+            now = time.time()
+            doc = self.hosts.find_one({"_id": host})
+            state = _new_state(burst, now) if doc is None else {key: doc[key] for key in _new_state(0, 0)}
+            result = change(state, now)
+            fields = dict(state, touched_at=datetime.now(timezone.utc))
+            if doc is None:
+                try:
+                    self.hosts.insert_one(dict(fields, _id=host, version=1))
+                    return result
+                except DuplicateKeyError:
+                    continue
+            updated = self.hosts.update_one(
+                {"_id": host, "version": doc["version"]},
+                {"$set": dict(fields, version=doc["version"] + 1)},
+            )
+            if updated.modified_count == 1:
+                return result
+            # Someone else got there first; try again on their state
+            time.sleep(random.uniform(0, 0.01))
+        logger.warning(f"Too many concurrent throttle updates for {host}; going ahead anyway")
+        return result
+
+class HostThrottle:
+    """
+    Throttles the requests to one host:
+
+    - a token bucket of `rate` requests per second with bursts of `burst`,
+      shared through `state` by every process using it;
+    - an adaptive concurrency limit (AIMD) in this process that grows by
+      one request per round of successes up to `max_concurrency`, and
+      halves on 429/503 responses or connection errors;
+    - `Retry-After` on 429/503 pauses the whole host until then;
+    - a circuit breaker that pauses the host for `cooldown` seconds after
+      `failure_threshold` consecutive failures instead of letting every
+      queued chapter fail against it.
+
+    A request that would have to wait more than `max_pause` seconds in
+    all for the host raises HostUnavailableError.
+    """
+    def __init__(self, host, state, rate=5.0, burst=10, max_concurrency=4,
+                 failure_threshold=5, cooldown=60, max_pause=600):
+        self.host = host
+        self.state = state
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_pause = max_pause
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.condition = threading.Condition()
+
+    @contextmanager
+    def request(self, max_pause=None):
+        """
+        Holds a request slot for the host. Call the yielded function with
+        the response so the throttle can adapt to it; an exception counts
+        as a failure. `max_pause` overrides the instance's for this request.
+        """
+        self._acquire(self.max_pause if max_pause is None else max_pause)
+        outcome = {}
+        try:
+            yield lambda response: outcome.setdefault("response", response)
+        except Exception:
+            self._release(None)
+            raise
+        self._release(outcome.get("response"))
+
+    def _acquire(self, max_pause):
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+        started = time.monotonic()
+        while True:
+            wait = self.state.take(self.host, self.rate, self.burst)
+            if wait <= 0:
+                return
+            if time.monotonic() - started + wait > max_pause:
+                self._finish()
+                raise HostUnavailableError(f"{self.host} is paused for another {wait:.0f}s")
+            # In steps, in case another process lifts or extends the pause
+            time.sleep(min(wait, 5))
+
+    def _release(self, response):
+        status = response.status_code if response is not None else None
+        failed = response is None or status in (429, 503) or status >= 500
+        if status in (429, 503):
+            retry_after = _retry_after(response)
+            if retry_after:
+                logger.warning(f"{self.host} asked us to retry after {retry_after:.0f}s")
+                self.state.block(self.host, time.time() + retry_after)
+
+        failures = self.state.record(self.host, not failed)
+        if failures >= self.failure_threshold:
+            logger.warning(f"Pausing {self.host} for {self.cooldown}s after {failures} failures")
+            self.state.block(self.host, time.time() + self.cooldown)
+
+        with self.condition:
+            if failed:
+                self.limit = max(1.0, self.limit / 2)
+            else:
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+        self._finish()
+
+    def _finish(self):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+def _retry_after(response):
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+_throttles = {}
+_throttles_lock = threading.Lock()
+_state_instance = None
+
+def get_throttle(url, **config):
+    """
+    Gets the process-wide throttle for the host of `url`, creating it with
+    `config` (see HostThrottle) on first use. State is shared through the
+    database once `use_database` has been called; otherwise through the
+    SQLite file at THROTTLE_STATE_PATH, which only the processes of one
+    node (or container) share, or kept in memory if that is set to "".
+    """
+    global _state_instance
+    hostname = urlparse(url).netloc.lower()
+    throttle = _throttles.get(hostname)
+    if throttle is None:
+        with _throttles_lock:
+            if _state_instance is None:
+                path = os.getenv("THROTTLE_STATE_PATH", os.path.join("cache", "throttle.sqlite3"))
+                _state_instance = SqliteThrottleState(path) if path else MemoryThrottleState()
+            throttle = _throttles.get(hostname)
+            if throttle is None:
+                throttle = HostThrottle(hostname, _state_instance, **config)
+                _throttles[hostname] = throttle
+    return throttle
+
+def use_database(database):
+    """Shares the throttle state of every process through `database` from now on."""
+    global _state_instance
+    state = MongoThrottleState(database)
+    with _throttles_lock:
+        _state_instance = state
+        for throttle in _throttles.values():
+            throttle.state = state
+    return state
@@ -0,0 +1,21 @@
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+def normalize_url(url):
+    """
+    Normalizes a URL so that trivially different spellings of the same page
+    map to the same key: lowercase scheme and host, no `www.`/`m.` prefix,
+    no default port, no fragment, sorted query and no trailing slash.
+    """
+    parts = urlparse(url.strip())
+    scheme = (parts.scheme or "https").lower()
+    hostname = (parts.hostname or "").lower()
+    if hostname.startswith('www.'):
+        hostname = hostname[4:]
+    elif hostname.startswith('m.'):
+        hostname = hostname[2:]
+    netloc = hostname
+    if parts.port and parts.port not in (80, 443):
+        netloc = f"{hostname}:{parts.port}"
+    path = parts.path.rstrip('/') or '/'
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunparse((scheme, netloc, path, '', query, ''))
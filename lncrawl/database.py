@@ -1,9 +1,29 @@
 import motor.motor_asyncio
+import pymongo
+from pymongo import UpdateOne
+from datetime import datetime, timezone
+
+from lncrawl.core.urls import normalize_url
 
 class Database:
-    def __init__(self, mongo_uri):
+    def __init__(self, mongo_uri, novel_info_ttl=6 * 3600, checkpoint_ttl=3 * 24 * 3600):
         self.client = motor.motor_asyncio.AsyncIOMotorClient(mongo_uri)
         self.db = self.client.lightnovel_bot
+        # Parsers run in worker threads without an event loop, so they use a
+        # regular pymongo client for the same database.
+        self.sync_client = pymongo.MongoClient(mongo_uri)
+        self.sync_db = self.sync_client.lightnovel_bot
+        self.novel_info_ttl = novel_info_ttl
+        self.checkpoint_ttl = checkpoint_ttl
+
+    def ensure_indexes(self):
+        self.sync_db.novels.create_index("url", unique=True)
+        self.sync_db.novels.create_index("updated_at", expireAfterSeconds=self.novel_info_ttl)
+        self.sync_db.deliveries.create_index([("chat_id", 1), ("url", 1)], unique=True)
+        self.sync_db.checkpoints.create_index("key", unique=True)
+        self.sync_db.checkpoints.create_index("updated_at", expireAfterSeconds=self.checkpoint_ttl)
+        self.sync_db.checkpoint_chapters.create_index([("key", 1), ("url", 1)], unique=True)
+        self.sync_db.checkpoint_chapters.create_index("updated_at", expireAfterSeconds=self.checkpoint_ttl)
 
     async def get_user_settings(self, chat_id):
         return await self.db.user_settings.find_one({"chat_id": chat_id})
@@ -13,4 +33,73 @@ class Database:
             {"chat_id": chat_id},
             {"$set": settings},
             upsert=True
-        )
\ No newline at end of file
+        )
+
+    def get_novel_info(self, novel_url):
+        """Returns the cached title, author, cover and chapter list of a novel."""
+        return self.sync_db.novels.find_one({"url": normalize_url(novel_url)}, {"_id": 0})
+
+    def save_novel_info(self, novel_url, title, author, cover, chapters):
+        self.sync_db.novels.update_one(
+            {"url": normalize_url(novel_url)},
+            {"$set": {
+                "title": title,
+                "author": author,
+                "cover": cover,
+                "chapters": chapters,
+                "updated_at": datetime.now(timezone.utc),
+            }},
+            upsert=True
+        )
+
+    def get_delivered_chapters(self, chat_id, novel_url):
+        """Returns the chapter URLs last delivered to a chat for a novel."""
+        delivery = self.sync_db.deliveries.find_one({"chat_id": chat_id, "url": normalize_url(novel_url)})
+        return delivery["chapters"] if delivery else []
+
+    def save_delivered_chapters(self, chat_id, novel_url, chapter_urls):
+        self.sync_db.deliveries.update_one(
+            {"chat_id": chat_id, "url": normalize_url(novel_url)},
+            {"$set": {
+                "chapters": [normalize_url(url) for url in chapter_urls],
+                "delivered_at": datetime.now(timezone.utc),
+            }},
+            upsert=True
+        )
+
+    def get_checkpoint(self, key):
+        """Returns the saved progress of an unfinished crawl, if any."""
+        return self.sync_db.checkpoints.find_one({"key": key}, {"_id": 0})
+
+    def save_checkpoint(self, key, **fields):
+        self.sync_db.checkpoints.update_one(
+            {"key": key},
+            {"$set": dict(fields, updated_at=datetime.now(timezone.utc))},
+            upsert=True
+        )
+
+    def get_checkpoint_chapter_urls(self, key):
+        """Returns the URLs of the chapters saved for a crawl so far."""
+        return {c["url"] for c in self.sync_db.checkpoint_chapters.find({"key": key}, {"url": 1})}
+
+    def get_checkpoint_body(self, key, chapter_url):
+        chapter = self.sync_db.checkpoint_chapters.find_one(
+            {"key": key, "url": normalize_url(chapter_url)}, {"body": 1}
+        )
+        return chapter["body"] if chapter else None
+
+    def save_checkpoint_bodies(self, key, bodies):
+        """Saves downloaded chapter bodies, given as {chapter_url: body}."""
+        now = datetime.now(timezone.utc)
+        self.sync_db.checkpoint_chapters.bulk_write([
+            UpdateOne(
+                {"key": key, "url": normalize_url(url)},
+                {"$set": {"body": body, "updated_at": now}},
+                upsert=True
+            )
+            for url, body in bodies.items()
+        ], ordered=False)
+
+    def delete_checkpoint(self, key):
+        self.sync_db.checkpoint_chapters.delete_many({"key": key})
+        self.sync_db.checkpoints.delete_one({"key": key})
\ No newline at end of file
@@ -1,32 +1,140 @@
-import requests
+import itertools
+import logging
+import threading
+import time
 from bs4 import BeautifulSoup
+from collections import Counter, deque
+from concurrent.futures import BrokenExecutor, ThreadPoolExecutor
 from typing import List
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlparse
+
+from lncrawl.core.cache import get_chapter_cache
+from lncrawl.core.http import get_session
+from lncrawl.core.mirrors import get_mirror_group
+from lncrawl.core.parse_pool import can_offload, extract_chapter_body, get_parse_pool
+from lncrawl.core import metrics
+from lncrawl.core.throttle import HostUnavailableError, get_throttle
+
+logger = logging.getLogger(__name__)
+
+FAILED_CHAPTER_BODY = "<p><i>Chapter content could not be downloaded.</i></p>"
 
 class WebToEpubParser:
-    def __init__(self, novel_url):
+    # Per-host throttling, shared by all novels and jobs (see HostThrottle).
+    # Max simultaneous requests to a single host from this process
+    host_concurrency = 4
+    # Requests per second to a single host, and the allowed burst
+    rate_limit = 5.0
+    rate_burst = 10
+    # Extra attempts for a chapter before giving up on it
+    chapter_retries = 2
+    # Base delay in seconds between attempts, doubled after each failure
+    retry_backoff = 1.0
+    # Optional SoupStrainer for chapter pages. When set, only the matching
+    # parts of the page are parsed, which is much cheaper than a full tree.
+    chapter_parse_only = None
+    # Groups of base URLs that serve the same site. Requests to any of them
+    # go to the fastest healthy one, with hedging and failover (MirrorGroup).
+    mirror_groups = []
+    # Latency percentile of a mirror after which a request is also sent to
+    # the next best mirror
+    hedge_percentile = 0.95
+
+    def __init__(self, novel_url, database=None, chapter_range=None):
         self.novel_url = novel_url
+        self.database = database
+        # A ChapterRange when only some chapters are wanted
+        self.chapter_range = chapter_range
+        # Whether the chapter list read is the whole table of contents
+        self.toc_complete = True
         self.dom = None
         self.chapters = []
         self.novel_title = ""
         self.novel_author = ""
         self.novel_cover = ""
+        # Per-job counters and timings, summarized by the bot once a job ends.
+        # The same figures feed the process-wide metrics in core.metrics.
+        self.stats = Counter()
+        # Chapters that only got FAILED_CHAPTER_BODY
+        self.failed_urls = set()
+        self.stats_lock = threading.Lock()
+
+    def count(self, **amounts):
+        with self.stats_lock:
+            self.stats.update(amounts)
 
     def absolute_url(self, url):
         return urljoin(self.novel_url, url)
 
-    def fetch_dom(self, url):
-        response = requests.get(url)
+    def fetch(self, url, **kwargs):
+        group = get_mirror_group(url, self.mirror_groups, hedge_percentile=self.hedge_percentile)
+        if group is None:
+            return self._fetch_once(url, **kwargs)
+        return group.fetch(
+            url,
+            lambda mirror_url, max_pause: self._fetch_once(mirror_url, max_pause=max_pause, **kwargs),
+        )
+
+    def _fetch_once(self, url, max_pause=None, **kwargs):
+        throttle = get_throttle(
+            url,
+            rate=self.rate_limit,
+            burst=self.rate_burst,
+            max_concurrency=self.host_concurrency,
+        )
+        host = urlparse(url).hostname
+        start = time.perf_counter()
+        with throttle.request(max_pause=max_pause) as record:
+            response = get_session().get(url, **kwargs)
+            record(response)
+        elapsed = time.perf_counter() - start
+        size = len(response.content)
+        metrics.DOWNLOADED_BYTES.inc(size, host=host)
+        self.count(requests=1, bytes=size, fetch_seconds=elapsed)
+        return response
+
+    def parse_dom(self, content, parse_only=None):
+        return BeautifulSoup(content, "lxml", parse_only=parse_only)
+
+    def fetch_dom(self, url, parse_only=None):
+        response = self.fetch(url)
         response.raise_for_status()
-        return BeautifulSoup(response.content, "lxml")
+        return self.parse_dom(response.content, parse_only=parse_only)
 
     def get_chapter_urls(self, dom) -> List[dict]:
         raise NotImplementedError()
 
+    def toc_covered(self, chapters):
+        """
+        Parsers that page through the table of contents can call this with
+        the chapters found so far and stop once it returns True: the rest
+        isn't needed for the requested chapter range. The list is then
+        incomplete and isn't stored.
+        """
+        if self.chapter_range and self.chapter_range.covered(len(chapters)):
+            self.toc_complete = False
+            return True
+        return False
+
+    def selected_chapters(self):
+        """The chapters in the requested range, or all of them."""
+        if self.chapter_range:
+            return self.chapter_range.select(self.chapters)
+        return self.chapters
+
     def find_content(self, dom) -> str:
         raise NotImplementedError()
 
-    def read_novel_info(self):
+    def read_novel_info(self, refresh=False):
+        """
+        Reads the title, author, cover and chapter list of the novel. Stored
+        info is used if available unless `refresh` is set.
+        """
+        if self.database and not refresh and self.load_novel_info():
+            self.count(toc_stored=1)
+            return
+
+        start = time.perf_counter()
         self.dom = self.fetch_dom(self.novel_url)
         self.novel_title = self.extract_title(self.dom)
         self.novel_author = self.extract_author(self.dom)
@@ -40,10 +148,209 @@ class WebToEpubParser:
                 "url": chapter_data['url'],
             })
 
+        elapsed = time.perf_counter() - start
+        metrics.TOC_FETCH_SECONDS.observe(elapsed, host=urlparse(self.novel_url).hostname)
+        self.count(toc_seconds=elapsed)
+
+        if self.database and self.chapters and self.toc_complete:
+            self.save_novel_info()
+
+    def load_novel_info(self):
+        """Fills in the novel info from the database, if it has been stored."""
+        try:
+            info = self.database.get_novel_info(self.novel_url)
+        except Exception as e:
+            logger.warning(f"Could not read cached novel info for {self.novel_url}: {e}")
+            return False
+        if not info:
+            return False
+        self.novel_title = info['title']
+        self.novel_author = info['author']
+        self.novel_cover = info['cover']
+        self.chapters = [dict(chapter) for chapter in info['chapters']]
+        return True
+
+    def save_novel_info(self):
+        try:
+            self.database.save_novel_info(
+                self.novel_url,
+                title=self.novel_title,
+                author=self.novel_author,
+                cover=self.novel_cover,
+                chapters=[
+                    {"id": c['id'], "title": c['title'], "url": c['url']}
+                    for c in self.chapters
+                ],
+            )
+        except Exception as e:
+            logger.warning(f"Could not store novel info for {self.novel_url}: {e}")
+
     def download_chapter_body(self, chapter_url: str) -> str:
-        dom = self.fetch_dom(chapter_url)
-        content = self.find_content(dom)
-        return str(content)
+        cache = get_chapter_cache()
+        entry = cache.get(chapter_url) if cache else None
+        if entry and entry['fresh']:
+            self._count_chapter('cached')
+            return entry['body']
+
+        # Revalidate a stale entry instead of downloading it again
+        headers = {}
+        if entry and entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+
+        start = time.perf_counter()
+        response = self.fetch(chapter_url, headers=headers)
+        metrics.CHAPTER_FETCH_SECONDS.observe(
+            time.perf_counter() - start, host=urlparse(chapter_url).hostname
+        )
+        if response.status_code == 304 and entry:
+            cache.touch(chapter_url)
+            self._count_chapter('revalidated')
+            return entry['body']
+        response.raise_for_status()
+
+        start = time.perf_counter()
+        body = None
+        pool = get_parse_pool()
+        if pool and can_offload(type(self)):
+            # Parsing is CPU-bound; threads would only take turns on the GIL
+            try:
+                body = pool.submit(extract_chapter_body, type(self), self.novel_url, response.content).result()
+            except BrokenExecutor as e:
+                logger.error(f"Parse pool is broken, parsing in this process: {e}")
+        if body is None:
+            body = self.extract_chapter_body(response.content)
+        elapsed = time.perf_counter() - start
+        metrics.PARSE_SECONDS.observe(elapsed)
+        self.count(parse_seconds=elapsed)
+        self._count_chapter('downloaded')
+        if cache:
+            cache.put(
+                chapter_url,
+                body,
+                etag=response.headers.get('ETag'),
+                last_modified=response.headers.get('Last-Modified'),
+            )
+        return body
+
+    def extract_chapter_body(self, content) -> str:
+        """Parses a chapter page and returns the body of the chapter."""
+        dom = self.parse_dom(content, parse_only=self.chapter_parse_only)
+        if self.chapter_parse_only is not None and not dom.contents:
+            # The page doesn't look like we expected; fall back to a full parse
+            dom = self.parse_dom(content)
+        return str(self.find_content(dom))
+
+    def download_chapters(self, chapters=None, concurrency=4, on_progress=None, stored_urls=None) -> List[dict]:
+        """
+        Downloads the body of every chapter concurrently and stores it in
+        `chapter['body']`. Returns the chapters in their original order.
+        See `iter_chapters` for the arguments.
+        """
+        if chapters is None:
+            chapters = self.chapters
+        for chapter, body in self.iter_chapters(
+            chapters,
+            concurrency=concurrency,
+            window=len(chapters),
+            on_progress=on_progress,
+            stored_urls=stored_urls,
+        ):
+            chapter['body'] = body
+        return chapters
+
+    def iter_chapters(self, chapters, concurrency=4, window=32, on_progress=None, stored_urls=None, checkpoint=None):
+        """
+        Yields `(chapter, body)` for every chapter in order, as soon as the
+        chapter and all the ones before it are available.
+
+        At most `concurrency` chapters of this novel are fetched at a time,
+        and every request goes through the per-host throttle shared by all
+        novels. No more than `window` bodies are held at once, so memory
+        use doesn't grow with the length of the novel. Chapters that still
+        fail after `chapter_retries` retries get a placeholder body. If the
+        host stays paused for longer than the throttle's `max_pause`,
+        HostUnavailableError is raised instead.
+
+        Chapters whose URL is in `stored_urls` are taken from the chapter
+        cache, however old, and only downloaded if they are not there.
+        With a `checkpoint` (a CrawlCheckpoint), bodies it already has are
+        used as they are and every body downloaded is added to it.
+        `on_progress(done, total)` is called after each chapter finishes.
+        """
+        total = len(chapters)
+        stored_urls = stored_urls or set()
+        window = max(1, window, concurrency)
+        done = 0
+        done_lock = threading.Lock()
+
+        def worker(chapter):
+            nonlocal done
+            body = None
+            if checkpoint:
+                body = checkpoint.body(chapter)
+                if body is not None:
+                    self._count_chapter('resumed')
+            if body is None and chapter['url'] in stored_urls:
+                body = self._read_stored_body(chapter['url'])
+            if body is None:
+                body = self._download_with_retries(chapter['url'])
+                if checkpoint and body != FAILED_CHAPTER_BODY:
+                    checkpoint.add(chapter, body)
+            with done_lock:
+                done += 1
+                finished = done
+            if on_progress:
+                on_progress(finished, total)
+            return body
+
+        executor = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="chapter")
+        try:
+            pending = deque()
+            upcoming = iter(chapters)
+            for chapter in itertools.islice(upcoming, window):
+                pending.append((chapter, executor.submit(worker, chapter)))
+            while pending:
+                chapter, future = pending.popleft()
+                body = future.result()
+                for next_chapter in itertools.islice(upcoming, 1):
+                    pending.append((next_chapter, executor.submit(worker, next_chapter)))
+                yield chapter, body
+        finally:
+            # Don't keep downloading if the consumer stopped early
+            executor.shutdown(wait=True, cancel_futures=True)
+            if checkpoint:
+                checkpoint.flush()
+
+    def _read_stored_body(self, chapter_url):
+        cache = get_chapter_cache()
+        entry = cache.get(chapter_url, allow_stale=True) if cache else None
+        if not entry:
+            return None
+        self._count_chapter('stored')
+        return entry['body']
+
+    def _count_chapter(self, result):
+        metrics.CHAPTERS.inc(result=result)
+        self.count(**{result: 1})
+
+    def _download_with_retries(self, chapter_url):
+        for attempt in range(self.chapter_retries + 1):
+            try:
+                return self.download_chapter_body(chapter_url)
+            except HostUnavailableError:
+                # Every other chapter would fail the same way, so the whole crawl stops
+                raise
+            except Exception as e:
+                if attempt >= self.chapter_retries:
+                    logger.error(f"Failed to download chapter {chapter_url}: {e}")
+                    self._count_chapter('failed')
+                    self.failed_urls.add(chapter_url)
+                    return FAILED_CHAPTER_BODY
+                delay = self.retry_backoff * (2 ** attempt)
+                logger.warning(f"Retrying chapter {chapter_url} in {delay:.1f}s: {e}")
+                time.sleep(delay)
 
     def extract_title(self, dom):
         title_tag = dom.select_one("meta[property='og:title']")
@@ -1,9 +1,9 @@
 import os
 import logging
-import asyncio
-from flask import Flask, request
+from flask import Flask, Response, request
 from telegram import Update
 from bot import TelegramBot
+from lncrawl.core import metrics
 from dotenv import load_dotenv
 
 # --- Initialization ---
@@ -16,16 +16,23 @@ logger = logging.getLogger(__name__)
 
 # Create bot and app instances
 bot = TelegramBot()
+# One persistent event loop per worker process handles all updates
+bot.start_background_loop()
 app = Flask(__name__)
 
 @app.route(f"/{bot.TOKEN}", methods=["POST"])
 def webhook():
     """Endpoint that Telegram sends updates to."""
     update = Update.de_json(request.get_json(force=True), bot.application.bot)
-    # Run the async update processing in a new event loop
-    asyncio.run(bot.application.process_update(update))
+    # Hand the update to the background loop and answer right away
+    bot.submit_update(update)
     return "ok"
 
+@app.route("/metrics")
+def metrics_endpoint():
+    """Stage timings and counters of this process, for Prometheus to scrape."""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
 @app.route("/setup")
 def setup_webhook():
     """One-time setup page to register the webhook with Telegram."""
@@ -36,8 +43,8 @@ def setup_webhook():
     full_webhook_url = f"{webhook_url}/{bot.TOKEN}"
     
     try:
-        # Run the async set_webhook call in a new event loop
-        success = asyncio.run(bot.application.bot.set_webhook(full_webhook_url))
+        # Run the async set_webhook call on the bot's event loop
+        success = bot.run_coroutine(bot.application.bot.set_webhook(full_webhook_url))
         if success:
             logger.info("Webhook set successfully!")
             return "Webhook Setup Successful!", 200
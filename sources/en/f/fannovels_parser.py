@@ -1,6 +1,7 @@
 # Parser for FanNovel.com, FanNovels.com, and similar sites.
 # These sites use an AJAX call to load the chapter list.
 import re
+from bs4 import SoupStrainer
 from lncrawl.parser import WebToEpubParser
 
 class FanNovelsParser(WebToEpubParser):
@@ -9,6 +10,11 @@ class FanNovelsParser(WebToEpubParser):
         "https://fannovel.net/",
         "https://www.fannovel.com/",
     ]
+    # The same novels and chapter paths are served on every domain
+    mirror_groups = [base_url]
+
+    # Chapter pages only need the content block
+    chapter_parse_only = SoupStrainer(id='chapter-content')
 
     def get_chapter_urls(self, dom):
         """
@@ -44,6 +50,8 @@ class FanNovelsParser(WebToEpubParser):
                 'title': a.text.strip(),
                 'url': self.absolute_url(a['href'])
             })
+            if self.toc_covered(chapter_list):
+                break
             
         return chapter_list
 
@@ -0,0 +1,54 @@
+import logging
+import os
+import socket
+import threading
+from dotenv import load_dotenv
+
+from bot import TelegramBot
+from lncrawl.core import metrics
+from lncrawl.core.jobs import run_worker
+
+# --- Initialization ---
+load_dotenv()
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+def main():
+    """
+    Runs crawl jobs from the MongoDB job queue. Start as many of these
+    processes as needed, independently of the web server:
+
+        python worker.py
+    """
+    bot = TelegramBot()
+    if not bot.job_queue:
+        raise Exception("Workers need the MongoDB job queue: set MONGO_URI and JOB_QUEUE=mongo")
+    bot.start_background_loop()
+    # Workers have no web server, so metrics get their own port if wanted
+    metrics_port = int(os.getenv("METRICS_PORT", "0"))
+    if metrics_port:
+        metrics.start_http_server(metrics_port)
+
+    def handle_job(job):
+        bot.process_single_url(job['url'], job['chat_id'], bot.application.bot, job.get('options'))
+
+    threads = []
+    for i in range(int(os.getenv("WORKER_THREADS", "5"))):
+        worker_id = f"{socket.gethostname()}-{os.getpid()}-{i}"
+        thread = threading.Thread(
+            target=run_worker,
+            args=(bot.job_queue, handle_job, worker_id),
+            kwargs={"on_failed": bot.report_failed_job},
+            name=worker_id,
+        )
+        thread.start()
+        threads.append(thread)
+    logger.info(f"Started {len(threads)} job workers")
+    for thread in threads:
+        thread.join()
+
+if __name__ == "__main__":
+    main()